@@ -0,0 +1,124 @@
+"""Benchmarks `history --compare` over two week-long windows of synthetic sketches.
+
+A synthetic cursor serves realistic hourly and daily sketches (one sample
+every 5 s per name) for thousands of process names, so the client-side cost
+of query_comparison, and the sketch bytes it would receive, can be measured
+with and without daily rollups on any host.
+
+    python -m benchmarks.bench_compare
+    python -m benchmarks.bench_compare --names 5000 --days 7 --hourly
+"""
+import argparse
+import io
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from rich.console import Console
+
+from src.procmon.history import query_comparison
+from src.procmon.sketch import DDSketch
+
+SAMPLES_PER_HOUR = 720
+# Distinct sketches generated per kind; names reuse them, which costs the same to merge.
+POOL_SIZE = 32
+
+
+def make_hourly_pool(rng):
+    pool = []
+    for _ in range(POOL_SIZE):
+        cpu, memory = DDSketch(), DDSketch()
+        scale = rng.uniform(0.5, 20)
+        for _ in range(SAMPLES_PER_HOUR):
+            cpu.add(rng.lognormvariate(0, 1) * scale)
+            memory.add(rng.lognormvariate(0, 0.3) * scale / 4)
+        pool.append((cpu.to_bytes(), memory.to_bytes()))
+    return pool
+
+
+def make_daily_pool(rng, hourly):
+    pool = []
+    for _ in range(POOL_SIZE):
+        cpu, memory = DDSketch(), DDSketch()
+        for cpu_bytes, memory_bytes in rng.choices(hourly, k=24):
+            cpu.merge_bytes(cpu_bytes)
+            memory.merge_bytes(memory_bytes)
+        pool.append((cpu.to_bytes(), memory.to_bytes()))
+    return pool
+
+
+class SyntheticCursor:
+    """Answers query_comparison's two queries as PostgreSQL would for ``names`` names."""
+
+    def __init__(self, windows, names: int, rolled_up: bool, hourly, daily):
+        self.windows = windows
+        self.names = [f"proc-{i}" for i in range(names)]
+        self.rolled_up = rolled_up
+        self.hourly = hourly
+        self.daily = daily
+        self.pending = []
+        self.sketch_bytes = 0
+
+    def execute(self, query, params):
+        if "generate_series" in query:
+            return
+        day_labels, days, range_labels, range_starts, range_ends = params[:5]
+        self.pending = []
+        for index, name in enumerate(self.names):
+            for window in (0, 1):
+                sketches = [self.daily[(index + i) % POOL_SIZE] for i, label in enumerate(day_labels) if label == window]
+                for label, start, end in zip(range_labels, range_starts, range_ends):
+                    if label == window:
+                        hours = int((end - start).total_seconds() // 3600)
+                        sketches += [self.hourly[(index + i) % POOL_SIZE] for i in range(hours)]
+                self.sketch_bytes += sum(len(cpu) + len(memory) for cpu, memory in sketches)
+                self.pending.append((window, name, [cpu for cpu, _ in sketches], [memory for _, memory in sketches]))
+
+    def fetchall(self):
+        rows = []
+        for label, (start, end) in enumerate(self.windows):
+            days = []
+            day = start
+            while self.rolled_up and day + timedelta(days=1) <= end:
+                days.append(day)
+                day += timedelta(days=1)
+            rows.append((label, start, end, days))
+        return rows
+
+    def fetchmany(self, size):
+        page, self.pending = self.pending[:size], self.pending[size:]
+        return page
+
+
+def run(windows, names: int, rolled_up: bool, hourly, daily):
+    cur = SyntheticCursor(windows, names, rolled_up, hourly, daily)
+    console = Console(file=io.StringIO())
+    start = time.perf_counter()
+    query_comparison(console, cur, [(str(a), str(b)) for a, b in windows], None, "json", "cpu_p95", 10)
+    return time.perf_counter() - start, cur.sketch_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--names", type=int, default=2000, help="Distinct process names in each window.")
+    parser.add_argument("--days", type=int, default=7, help="Length of each window in days.")
+    parser.add_argument("--hourly", action="store_true", help="Also time the comparison without daily rollups (slow).")
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    hourly = make_hourly_pool(rng)
+    daily = make_daily_pool(rng, hourly)
+    a_start = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    b_start = a_start + timedelta(days=args.days)
+    windows = [(a_start, b_start), (b_start, b_start + timedelta(days=args.days))]
+
+    print(f"{args.names} names, two {args.days}-day windows\n")
+    print(f"{'sketches':>9} {'seconds':>9} {'sketch MB':>10}")
+    modes = [("daily", True)] + ([("hourly", False)] if args.hourly else [])
+    for label, rolled_up in modes:
+        elapsed, sketch_bytes = run(windows, args.names, rolled_up, hourly, daily)
+        print(f"{label:>9} {elapsed:>9.2f} {sketch_bytes / 1024**2:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+"""Benchmarks one ProcessChurnDetector poll against synthetic /proc trees.
+
+A temporary directory gets one pid directory with a stat file per process,
+so the cost of diffing the process table, per pid and per poll, can be
+measured for 1k to 100k processes on any host, along with the interval the
+detector backs off to at that size.
+
+    python -m benchmarks.bench_lifecycle
+    python -m benchmarks.bench_lifecycle --processes 1000,50000 --churn 0.01
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from src.procmon.lifecycle import PROC_ROOT, ProcessChurnDetector
+
+
+def stat_line(pid: int, name: str) -> bytes:
+    fields = ["S", "1"] + ["0"] * 9 + [str(pid % 100), "0"] + ["0"] * 6 + [str(pid), "0", "100"] + ["0"] * 20
+    return f"{pid} ({name}) {' '.join(fields)}\n".encode()
+
+
+def write_proc(root: str, pid: int):
+    os.mkdir(os.path.join(root, str(pid)))
+    with open(os.path.join(root, str(pid), "stat"), "wb") as f:
+        f.write(stat_line(pid, f"proc-{pid % 500}"))
+
+
+def remove_proc(root: str, pid: int):
+    os.unlink(os.path.join(root, str(pid), "stat"))
+    os.rmdir(os.path.join(root, str(pid)))
+
+
+def time_polls(root: str, processes: int, churn: float, polls: int) -> float:
+    """Returns the mean seconds per poll while ``churn`` of the pids are replaced between polls."""
+    detector = ProcessChurnDetector(proc_root=root)
+    detector.poll()
+    replaced = int(processes * churn)
+    next_pid = processes + 1
+    elapsed = 0.0
+    for poll in range(polls):
+        for pid in range(next_pid - processes, next_pid - processes + replaced):
+            remove_proc(root, pid)
+        for pid in range(next_pid, next_pid + replaced):
+            write_proc(root, pid)
+        next_pid += replaced
+        start = time.perf_counter()
+        detector.poll()
+        elapsed += time.perf_counter() - start
+        detector.drain()
+    return elapsed / polls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", default="1000,10000,50000,100000", help="Comma separated synthetic table sizes.")
+    parser.add_argument("--churn", type=float, default=0.001, help="Fraction of pids replaced between polls.")
+    parser.add_argument("--polls", type=int, default=20)
+    args = parser.parse_args()
+
+    detector = ProcessChurnDetector()
+    print(f"{'processes':>10} {'ms/poll':>9} {'us/pid':>8} {'interval s':>11}")
+    if ProcessChurnDetector.is_supported():
+        live = sum(name.isdigit() for name in os.listdir(PROC_ROOT))
+        seconds = time_polls(PROC_ROOT, live, 0, args.polls)
+        print(f"{'/proc':>10} {seconds * 1e3:>9.2f} {seconds * 1e6 / live:>8.2f} {detector.next_interval(seconds):>11.2f}")
+    for processes in (int(n) for n in args.processes.split(",")):
+        root = tempfile.mkdtemp(prefix="procmon-bench-proc-")
+        try:
+            for pid in range(1, processes + 1):
+                write_proc(root, pid)
+            seconds = time_polls(root, processes, args.churn, args.polls)
+        finally:
+            shutil.rmtree(root)
+        print(f"{processes:>10} {seconds * 1e3:>9.2f} {seconds * 1e6 / processes:>8.2f} {detector.next_interval(seconds):>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
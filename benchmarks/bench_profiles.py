@@ -0,0 +1,36 @@
+"""Measures the per-process cost of each metric profile on this host.
+
+    python -m benchmarks.bench_profiles
+    python -m benchmarks.bench_profiles --sweeps 20
+"""
+import argparse
+import time
+
+import psutil
+
+from src.procmon.batch import SampleBatch
+from src.procmon.metrics import PROFILES, ProcessSampler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sweeps", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'profile':>10} {'processes':>10} {'sweep ms':>9} {'us/process':>11}")
+    batch = SampleBatch()
+    for profile, metrics in PROFILES.items():
+        sampler = ProcessSampler(metrics)
+        sampler.sample(batch) # warm up: prime the process cache and cpu_percent
+        start = time.perf_counter()
+        for _ in range(args.sweeps):
+            batch.clear()
+            sampler.sample(batch)
+        elapsed = (time.perf_counter() - start) / args.sweeps
+        print(f"{profile:>10} {len(batch):>10} {elapsed * 1000:>9.2f} {elapsed / max(len(batch), 1) * 1e6:>11.1f}")
+
+    print(f"\nCPU count: {psutil.cpu_count()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Load-tests the HTTP API against a synthetic database.
+
+Keep-alive clients hammer /history with a mix of distinct filters while each
+query takes ``--query-ms`` on a pooled connection, so throughput and latency
+can be measured, with and without coalescing, on any host.
+
+    python -m benchmarks.bench_serve
+    python -m benchmarks.bench_serve --clients 64 --distinct 4 --query-ms 20
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from src.procmon.server import QueryServer
+
+
+class SyntheticCursor:
+    def __init__(self, rows: int, query_ms: float):
+        self.rows = rows
+        self.query_ms = query_ms
+        self.description = [("time",), ("pid",), ("name",), ("cpu_percent",), ("memory_percent",)]
+        self.pending = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, query, params):
+        time.sleep(self.query_ms / 1000)
+        self.pending = [("2024-01-01 00:00:00+00", pid, f"proc-{pid % 50}", 1.5, 0.25) for pid in range(self.rows)]
+
+    def fetchmany(self, size):
+        page, self.pending = self.pending[:size], self.pending[size:]
+        return page
+
+
+class SyntheticConnection:
+    closed = 0
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def cursor(self, name=None):
+        self.pool.queries += 1
+        return SyntheticCursor(self.pool.rows, self.pool.query_ms)
+
+    def rollback(self):
+        pass
+
+
+class SyntheticPool:
+    def __init__(self, rows: int, query_ms: float):
+        self.rows = rows
+        self.query_ms = query_ms
+        self.queries = 0
+
+    def getconn(self):
+        return SyntheticConnection(self)
+
+    def putconn(self, conn, close=False):
+        pass
+
+    def closeall(self):
+        pass
+
+
+async def read_response(reader):
+    status = int((await reader.readline()).split()[1])
+    headers = {}
+    while (line := await reader.readline()) != b"\r\n":
+        name, _, value = line.decode().partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if "content-length" in headers:
+        return status, await reader.readexactly(int(headers["content-length"]))
+    body = bytearray()
+    while size := int(await reader.readline(), 16):
+        body += await reader.readexactly(size)
+        await reader.readline()
+    await reader.readline()
+    return status, bytes(body)
+
+
+async def client(port: int, paths: list, deadline: float, latencies: list):
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    rng = random.Random()
+    try:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            writer.write(f"GET {rng.choice(paths)} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+            status, _ = await read_response(reader)
+            if status != 200:
+                raise RuntimeError(f"Unexpected status {status}")
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def run(args):
+    pool = SyntheticPool(args.rows, args.query_ms)
+    server = QueryServer(pool_size=args.pool_size, pool=pool)
+    listener = await server.start("127.0.0.1", 0)
+    port = listener.sockets[0].getsockname()[1]
+    paths = [f"/history?pid={pid}&limit={args.rows}" for pid in range(1, args.distinct + 1)]
+    latencies = []
+    deadline = time.perf_counter() + args.seconds
+    try:
+        await asyncio.gather(*(client(port, paths, deadline, latencies) for _ in range(args.clients)))
+    finally:
+        listener.close()
+        await listener.wait_closed()
+        server.close()
+
+    latencies.sort()
+    quantiles = statistics.quantiles(latencies, n=100)
+    print(f"{len(latencies)} requests in {args.seconds}s: {len(latencies) / args.seconds:.0f} req/s")
+    print(f"latency p50 {quantiles[49] * 1000:.1f} ms, p99 {quantiles[98] * 1000:.1f} ms")
+    print(f"{pool.queries} database queries ({len(latencies) / max(pool.queries, 1):.1f} requests per query)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=32, help="Concurrent keep-alive connections.")
+    parser.add_argument("--distinct", type=int, default=8, help="Number of distinct /history filters requested.")
+    parser.add_argument("--rows", type=int, default=100, help="Rows returned per query.")
+    parser.add_argument("--query-ms", type=float, default=10.0, help="Simulated database time per query.")
+    parser.add_argument("--pool-size", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Benchmarks sharded sampling against synthetic process tables.
+
+Each synthetic process costs roughly what psutil spends reading its /proc
+files, so sweep time can be measured for 1k to 100k processes on any host.
+
+    python -m benchmarks.bench_sharding
+    python -m benchmarks.bench_sharding --processes 100000 --workers 1,2,4,8
+"""
+import argparse
+import os
+import time
+
+from src.procmon.batch import SampleBatch
+from src.procmon.metrics import METRIC_COLUMNS, PROFILES, ProcessSampler
+from src.procmon.sharding import ShardedSampler
+
+
+class SyntheticShardSource:
+    """Pretends to sample ``total`` processes, spending ``cost_us`` on each."""
+
+    def __init__(self, metrics, shard: int, shard_count: int, total: int, cost_us: float):
+        self.pids = range(shard + 1, total + 1, shard_count)
+        self.metrics = metrics
+        self.cost = cost_us / 1e6
+
+    def sample(self, batch):
+        for pid in self.pids:
+            deadline = time.perf_counter() + self.cost
+            while time.perf_counter() < deadline:
+                pass
+            batch.append(
+                pid, f"proc-{pid % 500}", float(pid % 100), float(pid % 10),
+                *(pid * 512 if column in self.metrics else None for column in METRIC_COLUMNS)
+            )
+        return batch
+
+
+class SyntheticSourceFactory:
+    def __init__(self, total: int, cost_us: float):
+        self.total = total
+        self.cost_us = cost_us
+
+    def __call__(self, metrics, shard: int, shard_count: int):
+        return SyntheticShardSource(metrics, shard, shard_count, self.total, self.cost_us)
+
+
+def time_sweeps(sample, sweeps: int) -> float:
+    batch = SampleBatch()
+    sample(batch) # warm up: first sweep primes caches and shared memory segments
+    start = time.perf_counter()
+    for _ in range(sweeps):
+        batch.clear()
+        sample(batch)
+    return (time.perf_counter() - start) / sweeps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--processes", default="1000,10000,50000,100000", help="Comma separated synthetic table sizes.")
+    parser.add_argument("--workers", default=None, help="Comma separated worker counts (default: powers of two up to the CPU count).")
+    parser.add_argument("--cost-us", type=float, default=50.0, help="Simulated sampling cost per process in microseconds.")
+    parser.add_argument("--sweeps", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.workers:
+        worker_counts = [int(w) for w in args.workers.split(",")]
+    else:
+        worker_counts = [1]
+        while worker_counts[-1] * 2 <= (os.cpu_count() or 1):
+            worker_counts.append(worker_counts[-1] * 2)
+
+    start = time.perf_counter()
+    real_rows = len(ProcessSampler(PROFILES["standard"]).sample(SampleBatch()))
+    print(f"Inline psutil sweep of this host: {real_rows} processes in {time.perf_counter() - start:.3f}s\n")
+
+    print(f"{'processes':>10} {'workers':>8} {'sweep s':>9} {'speedup':>8}")
+    for total in (int(p) for p in args.processes.split(",")):
+        baseline = None
+        for workers in worker_counts:
+            sampler = ShardedSampler(workers, PROFILES["standard"], source_factory=SyntheticSourceFactory(total, args.cost_us))
+            try:
+                elapsed = time_sweeps(sampler.sample, args.sweeps)
+            finally:
+                sampler.close()
+            baseline = baseline or elapsed
+            print(f"{total:>10} {workers:>8} {elapsed:>9.3f} {baseline / elapsed:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""Soak test for the collector's per-sweep memory use under heavy pid churn.
+
+Runs the collector's sampling pipeline (ProcessSampler, SampleBatch,
+sketches, snapshot publishing and row streaming) against a simulated
+process table for hours of virtual time, and fails if RSS keeps growing
+after warm-up. No database is needed.
+
+    python -m benchmarks.soak_collector
+    python -m benchmarks.soak_collector --hours 24 --processes 5000 --churn 0.2
+"""
+import argparse
+import collections
+import contextlib
+import os
+import random
+import sys
+import tempfile
+import time
+from unittest import mock
+
+import psutil
+
+from src.procmon import metrics as metrics_module
+from src.procmon.batch import SampleBatch
+from src.procmon.metrics import PROFILES, ProcessSampler
+from src.procmon.sketch import SketchAccumulator
+from src.procmon.snapshot import SnapshotWriter
+
+SWEEP_INTERVAL = 5 # virtual seconds, matching the collector
+SKETCH_FLUSH_SWEEPS = 12
+MAX_PID = 4194304
+
+_memory = collections.namedtuple("memory", "rss vms uss")
+_ctx = collections.namedtuple("ctx", "voluntary involuntary")
+_io = collections.namedtuple("io", "read_bytes write_bytes")
+
+
+class ChurnSimulator:
+    """A process table where ``churn`` of the processes are replaced every sweep."""
+
+    def __init__(self, processes: int, churn: float, unique_names: float, seed: int = 1):
+        self.rng = random.Random(seed)
+        self.churn = churn
+        self.unique_names = unique_names
+        self.next_pid = 1
+        self.spawned = 0
+        self.names = {}
+        for _ in range(processes):
+            self._spawn()
+
+    def _spawn(self):
+        while self.next_pid in self.names:
+            self.next_pid = self.next_pid % MAX_PID + 1
+        self.spawned += 1
+        if self.rng.random() < self.unique_names:
+            # e.g. per-job wrapper scripts: a name seen once and never again
+            name = f"job-{self.spawned}"
+        else:
+            name = f"worker-{self.rng.randrange(200)}"
+        self.names[self.next_pid] = name
+        self.next_pid = self.next_pid % MAX_PID + 1
+
+    def step(self):
+        victims = self.rng.sample(list(self.names), int(len(self.names) * self.churn))
+        for pid in victims:
+            del self.names[pid]
+        for _ in victims:
+            self._spawn()
+
+    def pids(self):
+        return list(self.names)
+
+    def process(self, pid):
+        if pid not in self.names:
+            raise psutil.NoSuchProcess(pid)
+        return FakeProcess(self, pid)
+
+
+class FakeProcess:
+    """Just enough of psutil.Process for metrics.sample_process."""
+
+    def __init__(self, simulator, pid):
+        self.simulator = simulator
+        self.pid = pid
+
+    def oneshot(self):
+        return contextlib.nullcontext()
+
+    def _check(self):
+        if self.pid not in self.simulator.names:
+            raise psutil.NoSuchProcess(self.pid)
+
+    def name(self):
+        self._check()
+        return self.simulator.names[self.pid]
+
+    def cpu_percent(self):
+        return float(self.pid % 100)
+
+    def memory_info(self):
+        return _memory(self.pid * 4096, self.pid * 8192, self.pid * 2048)
+
+    memory_full_info = memory_info
+
+    def num_threads(self):
+        return self.pid % 16 + 1
+
+    def num_fds(self):
+        return self.pid % 64
+
+    def num_ctx_switches(self):
+        return _ctx(self.pid, self.pid // 2)
+
+    def io_counters(self):
+        return _io(self.pid * 10, self.pid * 5)
+
+
+def run_soak(hours: float, processes: int, churn: float, unique_names: float = 0.01, profile: str = "full", report=None):
+    """Runs the simulated pipeline and returns per-virtual-hour measurements."""
+    simulator = ChurnSimulator(processes, churn, unique_names)
+    # Created before psutil is patched below.
+    this_process = psutil.Process(os.getpid())
+    metrics = PROFILES[profile]
+    sampler = ProcessSampler(metrics)
+    batch = SampleBatch()
+    sketches = SketchAccumulator()
+    snapshot_path = os.path.join(tempfile.mkdtemp(prefix="procmon-soak-"), "snapshot.bin")
+    snapshot = SnapshotWriter(snapshot_path, capacity=processes * 2)
+    discard = collections.deque(maxlen=0)
+    sweeps_per_hour = 3600 // SWEEP_INTERVAL
+    total_sweeps = int(hours * sweeps_per_hour)
+    history = []
+
+    with mock.patch.object(metrics_module.psutil, "pids", simulator.pids), \
+            mock.patch.object(metrics_module.psutil, "Process", simulator.process):
+        try:
+            for sweep in range(1, total_sweeps + 1):
+                sweep_time = sweep * SWEEP_INTERVAL
+                simulator.step()
+                batch.clear()
+                sampler.sample(batch)
+                sketches.add_batch(sweep_time, batch)
+                snapshot.publish(sweep_time, (0.0, 0.0, 0, 0, 0, 0), batch)
+                discard.extend(batch.rows(metrics))
+                if sweep % SKETCH_FLUSH_SWEEPS == 0:
+                    for cpu_sketch, memory_sketch in sketches.drain().values():
+                        cpu_sketch.to_bytes()
+                        memory_sketch.to_bytes()
+                if sweep % sweeps_per_hour == 0 or sweep == total_sweeps:
+                    entry = {
+                        "hour": sweep / sweeps_per_hour,
+                        "rss": this_process.memory_info().rss,
+                        "cached_processes": len(sampler.processes),
+                        "batch_capacity": batch.capacity,
+                        "spawned": simulator.spawned,
+                    }
+                    history.append(entry)
+                    if report:
+                        report(entry)
+        finally:
+            snapshot.close()
+            os.rmdir(os.path.dirname(snapshot_path))
+    return history
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hours", type=float, default=6.0, help="Virtual hours to simulate.")
+    parser.add_argument("--processes", type=int, default=2000)
+    parser.add_argument("--churn", type=float, default=0.1, help="Fraction of processes replaced every sweep.")
+    parser.add_argument("--unique-names", type=float, default=0.01, help="Fraction of new processes with a never-repeated name.")
+    parser.add_argument("--profile", choices=list(PROFILES), default="full")
+    parser.add_argument("--max-growth-mb", type=float, default=8.0, help="Allowed RSS growth after the first virtual hour.")
+    args = parser.parse_args()
+
+    print(f"{'hour':>6} {'rss MB':>8} {'cached':>7} {'capacity':>9} {'spawned':>9}")
+    start = time.perf_counter()
+    history = run_soak(
+        args.hours, args.processes, args.churn, args.unique_names, args.profile,
+        report=lambda e: print(f"{e['hour']:>6.1f} {e['rss'] / 1024**2:>8.1f} {e['cached_processes']:>7} {e['batch_capacity']:>9} {e['spawned']:>9}")
+    )
+    print(f"\nSimulated {args.hours}h in {time.perf_counter() - start:.1f}s")
+
+    baseline = history[0]["rss"]
+    ceiling = max(entry["rss"] for entry in history[1:]) if len(history) > 1 else baseline
+    growth = (ceiling - baseline) / 1024**2
+    print(f"RSS after first hour: {baseline / 1024**2:.1f} MB, ceiling: {ceiling / 1024**2:.1f} MB, growth: {growth:.1f} MB")
+    if growth > args.max_growth_mb:
+        print(f"FAIL: RSS grew by more than {args.max_growth_mb} MB")
+        sys.exit(1)
+    print("OK: RSS stayed flat")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import sys
+from array import array
+
+from .metrics import METRIC_COLUMNS
+
+# Stored for metrics the profile did not collect or the process did not
+# let us read, including CPU and memory percent.
+MISSING = -1
+DEFAULT_CAPACITY = 1024
+
+
+class SampleBatch:
+    """One sweep's samples, held in reusable array-backed columns.
+
+    The collector keeps a single batch for its whole lifetime and calls
+    ``clear()`` before every sweep, so steady-state sampling allocates no
+    per-process objects. Columns only ever grow, to the largest process
+    table seen. Process names are interned, so the many processes sharing
+    a name share one string; unreadable names stay None.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        self.capacity = 0
+        self.length = 0
+        self.pids = array("q")
+        self.cpu = array("d")
+        self.memory = array("d")
+        self.metrics = [array("q") for _ in METRIC_COLUMNS]
+        self.names = []
+        self._grow(capacity)
+
+    def _grow(self, extra: int):
+        self.capacity += extra
+        for column in (self.pids, self.cpu, self.memory, *self.metrics):
+            column.extend(array(column.typecode, bytes(extra * column.itemsize)))
+        self.names.extend([None] * extra)
+
+    def clear(self):
+        self.length = 0
+
+    def __len__(self):
+        return self.length
+
+    def append(self, pid, name, cpu_percent, memory_percent, *values):
+        """Appends one sample; percents and ``values`` (following METRIC_COLUMNS) are None if missing."""
+        i = self.length
+        if i == self.capacity:
+            self._grow(self.capacity)
+        self.pids[i] = pid
+        self.names[i] = None if name is None else sys.intern(name)
+        self.cpu[i] = MISSING if cpu_percent is None else cpu_percent
+        self.memory[i] = MISSING if memory_percent is None else memory_percent
+        for column, value in zip(self.metrics, values, strict=True):
+            column[i] = MISSING if value is None else value
+        self.length = i + 1
+
+    def row(self, i: int):
+        """Returns sample ``i`` as a tuple ordered like ``metrics.ROW_FIELDS``."""
+        return (
+            self.pids[i], self.names[i],
+            *(None if column[i] == MISSING else column[i] for column in (self.cpu, self.memory, *self.metrics))
+        )
+
+    def rows(self, metric_columns=METRIC_COLUMNS):
+        """Yields ``(pid, name, cpu_percent, memory_percent, *metrics)`` tuples.
+
+        Only the requested metric columns are included, which lets the
+        collector stream rows straight into an INSERT for its profile.
+        """
+        columns = [self.cpu, self.memory, *(self.metrics[METRIC_COLUMNS.index(metric)] for metric in metric_columns)]
+        for i in range(self.length):
+            yield (
+                self.pids[i], self.names[i],
+                *(None if column[i] == MISSING else column[i] for column in columns)
+            )
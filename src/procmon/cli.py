@@ -6,8 +6,13 @@ from rich.table import Table
 import psutil
 import time
 from .db import setup_database
-from .collector import read_pid_file, delete_pid_file, HAS_NVML
-from .history import query_history
+from .collector import read_pid_file, delete_pid_file
+from .gpu import load_nvml
+from .history import query_history, COMPARE_METRICS, DEFAULT_MIN_CHANGE
+from .snapshot import read_snapshot, top_processes, TOP_KEYS, TOP_N
+from .maintenance import show_db_stats, run_maintenance, RETENTION, SKETCH_RETENTION, COMPRESS_AFTER, REFRESH_WINDOW
+from .server import serve as run_server, SERVE_HOST, SERVE_PORT, POOL_SIZE
+import json
 import os
 import signal
 from rich.live import Live
@@ -22,11 +27,16 @@ def main():
     pass
 
 @main.command()
-def live():
+@click.option('--attach', is_flag=True, help='Read the running collector\'s shared snapshot instead of scanning processes.')
+def live(attach):
     """Display a live view of system processes."""
     console = Console()
     last_sort_time = 0
     process_list = []
+    try:
+        nvml = load_nvml()
+    except ValueError as e:
+        raise click.ClickException(str(e))
 
     def generate_layout() -> Layout:
         nonlocal last_sort_time, process_list
@@ -39,68 +49,83 @@ def live():
         progress_bar_width = max(20, min(50, terminal_width // 3))
         
         # Header with system overview
-        mem = psutil.virtual_memory()
-        cpu_percent = psutil.cpu_percent(interval=None)
-        disk_io = psutil.disk_io_counters()
-
-        mem_bar = ProgressBar(total=100, completed=mem.percent, width=progress_bar_width)
-        cpu_bar = ProgressBar(total=100, completed=cpu_percent, width=progress_bar_width)
+        # Without a snapshot there are no totals to show; say so instead of zeros.
+        no_snapshot = False
+        if attach:
+            snapshot = read_snapshot()
+            if snapshot:
+                system = snapshot["system"]
+                process_list = snapshot["top"]["cpu"]
+                cpu_percent = system["cpu_percent"]
+                mem_percent = system["memory_percent"]
+                mem_used, mem_total = system["memory_used"], system["memory_total"]
+                disk_read, disk_write = system["disk_read_bytes"], system["disk_write_bytes"]
+            else:
+                no_snapshot = True
+                process_list = []
+                disk_read = disk_write = None
+        else:
+            mem = psutil.virtual_memory()
+            cpu_percent = psutil.cpu_percent(interval=None)
+            disk_io = psutil.disk_io_counters()
+            mem_percent, mem_used, mem_total = mem.percent, mem.used, mem.total
+            disk_read = disk_io.read_bytes if disk_io else None
+            disk_write = disk_io.write_bytes if disk_io else None
 
         # Dynamic grid layout
         grid = Table.grid(expand=True)
         grid.add_column(justify="left", min_width=20, ratio=1)
         grid.add_column(justify="left", min_width=progress_bar_width, ratio=2)
-        
-        grid.add_row(f"[bold green]CPU Usage[/]: {cpu_percent:.1f}%", cpu_bar)
-        grid.add_row(
-            f"[bold yellow]Memory[/]: {mem.used/1024**3:.1f}G/{mem.total/1024**3:.1f}G ({mem.percent:.1f}%)", 
-            mem_bar
-        )
+
+        if no_snapshot:
+            grid.add_row("[bold red]Collector is not running[/]: no snapshot to attach to (start it with 'procmon start-collector')", "")
+        else:
+            mem_bar = ProgressBar(total=100, completed=mem_percent, width=progress_bar_width)
+            cpu_bar = ProgressBar(total=100, completed=cpu_percent, width=progress_bar_width)
+            grid.add_row(f"[bold green]CPU Usage[/]: {cpu_percent:.1f}%", cpu_bar)
+            grid.add_row(
+                f"[bold yellow]Memory[/]: {mem_used/1024**3:.1f}G/{mem_total/1024**3:.1f}G ({mem_percent:.1f}%)", 
+                mem_bar
+            )
 
         gpu_rows = 0
-        if HAS_NVML:
-            from pynvml import nvmlInit, nvmlDeviceGetCount, nvmlDeviceGetHandleByIndex, nvmlDeviceGetUtilizationRates, nvmlShutdown, NVMLError
+        if nvml:
             try:
-                nvmlInit()
-                device_count = nvmlDeviceGetCount()
+                nvml.nvmlInit()
+                device_count = nvml.nvmlDeviceGetCount()
                 for i in range(device_count):
-                    handle = nvmlDeviceGetHandleByIndex(i)
-                    utilization = nvmlDeviceGetUtilizationRates(handle)
+                    handle = nvml.nvmlDeviceGetHandleByIndex(i)
+                    utilization = nvml.nvmlDeviceGetUtilizationRates(handle)
                     gpu_percent = utilization.gpu
                     gpu_bar = ProgressBar(total=100, completed=gpu_percent, width=progress_bar_width)
                     grid.add_row(f"[bold red]GPU {i}[/]: {gpu_percent:.1f}%", gpu_bar)
                     gpu_rows += 1
-            except NVMLError:
+            except nvml.NVMLError:
                 pass
             finally:
                 try:
-                    nvmlShutdown()
-                except NVMLError:
+                    nvml.nvmlShutdown()
+                except nvml.NVMLError:
                     pass
         
         disk_rows = 0
-        if disk_io:
-            disk_text = f"[bold blue]Disk I/O[/]: R:{disk_io.read_bytes/1024**3:.1f}GB W:{disk_io.write_bytes/1024**3:.1f}GB"
+        if disk_read is not None:
+            disk_text = f"[bold blue]Disk I/O[/]: R:{disk_read/1024**3:.1f}GB W:{disk_write/1024**3:.1f}GB"
             grid.add_row(disk_text, "")
             disk_rows = 1
 
         # Calculate dynamic process table dimensions
-        overview_rows = 2 + gpu_rows + disk_rows  # CPU, Memory + GPUs + Disk
-        overview_panel_height = overview_rows * 2  # Add padding for panel borders and title
+        overview_rows = (1 if no_snapshot else 2) + gpu_rows + disk_rows  # CPU, Memory (or the missing-collector notice) + GPUs + Disk
+        overview_panel_height = max(overview_rows * 2, overview_rows + 2)  # Add padding for panel borders and title
 
         # Dynamic GPU panel
         gpu_panel_item = None
         gpu_panel_height = 0
         
-        if HAS_NVML:
-            from pynvml import (nvmlInit, nvmlDeviceGetCount, nvmlDeviceGetHandleByIndex, 
-                              nvmlDeviceGetName, nvmlDeviceGetUtilizationRates, nvmlShutdown, 
-                              NVMLError, NVML_TEMPERATURE_GPU, nvmlDeviceGetTemperature, 
-                              nvmlDeviceGetFanSpeed, nvmlDeviceGetPowerUsage)
-            
+        if nvml:
             try:
-                nvmlInit()
-                device_count = nvmlDeviceGetCount()
+                nvml.nvmlInit()
+                device_count = nvml.nvmlDeviceGetCount()
                 if device_count > 0:
                     # Calculate dynamic column widths for GPU table
                     gpu_table_width = min(terminal_width - 4, 120)  # Leave margin, max 120
@@ -127,41 +152,41 @@ def live():
                     gpu_table.add_column("Power W", justify="right", style="purple", width=col_widths['power'])
 
                     for i in range(device_count):
-                        handle = nvmlDeviceGetHandleByIndex(i)
+                        handle = nvml.nvmlDeviceGetHandleByIndex(i)
                         
                         try:
-                            gpu_name = nvmlDeviceGetName(handle)
+                            gpu_name = nvml.nvmlDeviceGetName(handle)
                             # Truncate long GPU names to fit
                             # if len(gpu_name) > col_widths['name']:
                                 # gpu_name = gpu_name[:col_widths['name']] + "..."
-                        except NVMLError:
+                        except nvml.NVMLError:
                             gpu_name = "Unknown"
                         
                         # Get all GPU metrics with error handling
                         try:
-                            utilization = nvmlDeviceGetUtilizationRates(handle)
+                            utilization = nvml.nvmlDeviceGetUtilizationRates(handle)
                             gpu_util = f"{utilization.gpu:.0f}"
                             mem_util = f"{utilization.memory:.0f}"
-                        except NVMLError:
+                        except nvml.NVMLError:
                             gpu_util = "N/A"
                             mem_util = "N/A"
 
                         try:
-                            temperature = nvmlDeviceGetTemperature(handle, NVML_TEMPERATURE_GPU)
+                            temperature = nvml.nvmlDeviceGetTemperature(handle, nvml.NVML_TEMPERATURE_GPU)
                             temp_str = f"{temperature:.0f}"
-                        except NVMLError:
+                        except nvml.NVMLError:
                             temp_str = "N/A"
 
                         try:
-                            fan_speed = nvmlDeviceGetFanSpeed(handle)
+                            fan_speed = nvml.nvmlDeviceGetFanSpeed(handle)
                             fan_str = f"{fan_speed:.0f}"
-                        except NVMLError:
+                        except nvml.NVMLError:
                             fan_str = "N/A"
 
                         try:
-                            power_usage = nvmlDeviceGetPowerUsage(handle) / 1000
+                            power_usage = nvml.nvmlDeviceGetPowerUsage(handle) / 1000
                             power_str = f"{power_usage:.0f}"
-                        except NVMLError:
+                        except nvml.NVMLError:
                             power_str = "N/A"
 
                         gpu_table.add_row(str(i), gpu_name, gpu_util, mem_util, temp_str, fan_str, power_str)
@@ -169,12 +194,12 @@ def live():
                     gpu_panel_height = device_count + 8  # rows + header + borders + title
                     gpu_panel_item = Panel(gpu_table, border_style="red", expand=True)
                     
-            except NVMLError:
+            except nvml.NVMLError:
                 pass
             finally:
                 try:
-                    nvmlShutdown()
-                except NVMLError:
+                    nvml.nvmlShutdown()
+                except nvml.NVMLError:
                     pass
 
         # Dynamic Process Table
@@ -191,6 +216,8 @@ def live():
             'name': max(15, terminal_width // 6),
             'cpu': max(8, terminal_width // 18),
             'memory': max(10, terminal_width // 15),
+            'rss': max(9, terminal_width // 15),
+            'threads': max(7, terminal_width // 20),
             'read': max(10, terminal_width // 15),
             'write': max(10, terminal_width // 15)
         }
@@ -199,16 +226,18 @@ def live():
         table.add_column("Process Name", style="magenta", width=col_ratios['name'])
         table.add_column("CPU %", justify="right", style="green", width=col_ratios['cpu'])
         table.add_column("Memory %", justify="right", style="yellow", width=col_ratios['memory'])
+        table.add_column("RSS MB", justify="right", style="yellow", width=col_ratios['rss'])
+        table.add_column("Threads", justify="right", style="cyan", width=col_ratios['threads'])
         table.add_column("Read MB", justify="right", style="blue", width=col_ratios['read'])
         table.add_column("Write MB", justify="right", style="red", width=col_ratios['write'])
 
         # Update process list periodically
         current_time = time.time()
-        if current_time - last_sort_time > 2:
+        if not attach and current_time - last_sort_time > 2:
             last_sort_time = current_time
             try:
                 process_list = sorted(
-                    psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent', 'io_counters']),
+                    psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent', 'memory_info', 'num_threads', 'io_counters']),
                     key=lambda p: p.info.get('cpu_percent', 0) or 0,
                     reverse=True
                 )
@@ -222,10 +251,26 @@ def live():
                 break
                 
             try:
+                if attach:
+                    pid, name = proc['pid'], proc['name']
+                    cpu_pct, mem_pct = proc['cpu_percent'], proc['memory_percent']
+                    rss_mb = proc['rss'] / 1024**2
+                    read_mb = proc['read_bytes'] / 1024**2
+                    write_mb = proc['write_bytes'] / 1024**2
+                    table.add_row(
+                        str(pid), name, f"{cpu_pct:.1f}", f"{mem_pct:.1f}", f"{rss_mb:.1f}",
+                        str(proc['num_threads']), f"{read_mb:.1f}", f"{write_mb:.1f}"
+                    )
+                    added_processes += 1
+                    continue
+
                 pid = proc.info.get('pid', 'N/A')
                 name = proc.info.get('name', 'Unknown')
                 cpu_pct = proc.info.get('cpu_percent', 0) or 0
                 mem_pct = proc.info.get('memory_percent', 0) or 0
+                memory_info = proc.info.get('memory_info')
+                rss_mb = memory_info.rss / 1024**2 if memory_info else 0
+                num_threads = proc.info.get('num_threads') or 0
                 
                 # Truncate long process names
                 # if len(name) > col_ratios['name'] - 2:
@@ -243,6 +288,8 @@ def live():
                     name,
                     f"{cpu_pct:.1f}",
                     f"{mem_pct:.1f}",
+                    f"{rss_mb:.1f}",
+                    str(num_threads),
                     f"{read_mb:.1f}",
                     f"{write_mb:.1f}",
                 )
@@ -290,6 +337,31 @@ def setup_db():
     setup_database()
     click.echo("Database setup complete.")
 
+@main.group()
+def db():
+    """Inspect and maintain the procmon database."""
+    pass
+
+@db.command()
+@click.option('--output-format', '-o', type=click.Choice(['table', 'json']), default='table', help='Output format for the statistics.')
+def stats(output_format):
+    """Show table and chunk sizes, compression, ingest rate and aggregate lag."""
+    show_db_stats(output_format)
+
+@db.command()
+@click.option('--retention', default=RETENTION, show_default=True, help='Drop raw data older than this interval.')
+@click.option('--sketch-retention', default=SKETCH_RETENTION, show_default=True, help='Drop percentile sketches older than this interval.')
+@click.option('--compress-after', default=COMPRESS_AFTER, show_default=True, help='Compress chunks older than this interval.')
+@click.option('--refresh-window', default=REFRESH_WINDOW, show_default=True, help='Refresh continuous aggregates over this trailing interval.')
+@click.option('--drop/--no-drop', default=True, help='Apply the retention policy.')
+@click.option('--reorder/--no-reorder', default=True, help='Reorder chunks by (name, time).')
+@click.option('--compress/--no-compress', default=True, help='Compress old chunks.')
+@click.option('--refresh/--no-refresh', default=True, help='Refresh continuous aggregates.')
+@click.option('--rollup/--no-rollup', default=True, help='Roll up hourly percentile sketches into daily ones.')
+def maintain(retention, sketch_retention, compress_after, refresh_window, drop, reorder, compress, refresh, rollup):
+    """Run retention, sketch rollup, reordering, compression and aggregate refresh now."""
+    run_maintenance(retention, sketch_retention, compress_after, refresh_window, drop, reorder, compress, refresh, rollup)
+
 @main.command()
 def start_collector():
     """Starts the background data collection service."""
@@ -329,6 +401,10 @@ def status_collector():
             try:
                 p = psutil.Process(pid)
                 click.echo(f"Collector is running with PID: {pid} (Name: {p.name()}, Status: {p.status()})")
+                snapshot = read_snapshot(max_age=None)
+                if snapshot:
+                    age = time.time() - snapshot["timestamp"]
+                    click.echo(f"Latest snapshot: {snapshot['process_count']} processes, {age:.1f}s old")
             except psutil.NoSuchProcess:
                 click.echo(f"Collector (PID: {pid}) not found, but PID file exists. Removing stale PID file.")
                 delete_pid_file()
@@ -338,6 +414,95 @@ def status_collector():
     else:
         click.echo("Collector is not running.")
 
+@main.command()
+@click.option('--once', is_flag=True, help='Print a single snapshot and exit.')
+@click.option('--json', 'as_json', is_flag=True, help='Print the snapshot as JSON.')
+@click.option('--sort', 'sort_key', type=click.Choice(TOP_KEYS), default='cpu', help='Key to rank processes by.')
+@click.option('--limit', '-l', type=click.IntRange(1), default=20, help='Number of processes to show.')
+def top(once, as_json, sort_key, limit):
+    """Show the top processes from the running collector's snapshot."""
+    console = Console()
+
+    def render():
+        # The snapshot indexes only the top TOP_N per key; rank the full table beyond that.
+        snapshot = read_snapshot(include_processes=limit > TOP_N)
+        if not snapshot:
+            return None
+        processes = top_processes(snapshot, sort_key, limit)
+        if as_json:
+            return json.dumps({
+                "timestamp": snapshot["timestamp"],
+                "collector_pid": snapshot["collector_pid"],
+                "process_count": snapshot["process_count"],
+                "system": snapshot["system"],
+                "processes": processes
+            })
+        system = snapshot["system"]
+        table = Table(title=(
+            f"Top Processes by {sort_key} - CPU {system['cpu_percent']:.1f}% "
+            f"Memory {system['memory_percent']:.1f}% ({snapshot['process_count']} processes, "
+            f"{time.time() - snapshot['timestamp']:.1f}s old)"
+        ))
+        table.add_column("PID", justify="right", style="cyan")
+        table.add_column("Process Name", style="magenta")
+        table.add_column("CPU %", justify="right", style="green")
+        table.add_column("Memory %", justify="right", style="yellow")
+        table.add_column("RSS MB", justify="right", style="yellow")
+        table.add_column("Threads", justify="right", style="cyan")
+        table.add_column("Read MB", justify="right", style="blue")
+        table.add_column("Write MB", justify="right", style="red")
+        for proc in processes:
+            table.add_row(
+                str(proc['pid']),
+                proc['name'],
+                f"{proc['cpu_percent']:.1f}",
+                f"{proc['memory_percent']:.1f}",
+                f"{proc['rss']/1024**2:.1f}",
+                str(proc['num_threads']),
+                f"{proc['read_bytes']/1024**2:.1f}",
+                f"{proc['write_bytes']/1024**2:.1f}"
+            )
+        return table
+
+    output = render()
+    if output is None:
+        click.echo("No collector snapshot available. Is the collector running?", err=True)
+        sys.exit(1)
+    if once:
+        if as_json:
+            click.echo(output)
+        else:
+            console.print(output)
+        return
+
+    if as_json:
+        try:
+            while output is not None:
+                click.echo(output)
+                time.sleep(1)
+                output = render()
+        except KeyboardInterrupt:
+            pass
+        return
+
+    with Live(output, console=console, refresh_per_second=1) as live_view:
+        try:
+            while output is not None:
+                time.sleep(1)
+                output = render()
+                if output is not None:
+                    live_view.update(output)
+        except KeyboardInterrupt:
+            pass
+
+@main.command()
+@click.option('--host', default=SERVE_HOST, show_default=True, help='Address to listen on.')
+@click.option('--port', type=int, default=SERVE_PORT, show_default=True, help='Port to listen on.')
+@click.option('--pool-size', type=click.IntRange(1), default=POOL_SIZE, show_default=True, help='Database connections kept open for queries.')
+def serve(host, port, pool_size):
+    """Serve history queries and the live snapshot over a local JSON HTTP API."""
+    run_server(host, port, pool_size)
+
 @main.command()
 @click.option('--process-name', '-n', help='Filter by process name (case-insensitive, partial match).')
 @click.option('--pid', '-p', type=int, help='Filter by process ID.')
@@ -347,9 +512,22 @@ def status_collector():
 @click.option('--output-format', '-o', type=click.Choice(['table', 'json', 'csv']), default='table', help='Output format for the historical data.')
 @click.option('--gpu', is_flag=True, help='Query GPU usage history.')
 @click.option('--gpu-index', type=int, help='Filter GPU usage by GPU index.')
-def history(process_name, pid, start_time, end_time, aggregate, output_format, gpu, gpu_index):
+@click.option('--percentile', 'percentiles', help='Report CPU/memory percentiles per process name (e.g., "95,99").')
+@click.option('--lifecycle', is_flag=True, help='Query short-lived processes captured between sweeps.')
+@click.option('--gpu-processes', is_flag=True, help='Query GPU memory and utilization attributed to processes.')
+@click.option('--compare', nargs=2, metavar='WINDOW_A WINDOW_B', help='Compare two "start..end" windows per process name.')
+@click.option('--min-change', type=click.FloatRange(0), default=DEFAULT_MIN_CHANGE, show_default=True, help='Smallest relative change, in percent, reported by --compare.')
+@click.option('--rank-by', type=click.Choice(COMPARE_METRICS), default='cpu_p95', show_default=True, help='Metric --compare ranks changes by.')
+def history(process_name, pid, start_time, end_time, aggregate, output_format, gpu, gpu_index, percentiles, lifecycle, gpu_processes, compare, min_change, rank_by):
     """Query historical process data."""
-    query_history(process_name, pid, start_time, end_time, aggregate, output_format, gpu, gpu_index)
+    if lifecycle:
+        conflicts = [option for option, value in (
+            ('--aggregate', aggregate), ('--gpu', gpu), ('--gpu-index', gpu_index is not None),
+            ('--gpu-processes', gpu_processes), ('--percentile', percentiles), ('--compare', compare)
+        ) if value]
+        if conflicts:
+            raise click.UsageError(f"--lifecycle cannot be combined with {', '.join(conflicts)}.")
+    query_history(process_name, pid, start_time, end_time, aggregate, output_format, gpu, gpu_index, percentiles, lifecycle, gpu_processes, compare, min_change, rank_by)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
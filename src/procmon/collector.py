@@ -1,21 +1,28 @@
 
 import psutil
+import signal
 import time
 from psycopg2 import Error
+from psycopg2.extras import execute_values
 from .db import get_db_connection
+from .sketch import DDSketch, SketchAccumulator
+from .snapshot import SnapshotWriter
+from .lifecycle import ProcessChurnDetector
+from .sharding import ShardedSampler, COLLECTOR_WORKERS
+from .metrics import METRIC_PROFILE, ProcessSampler, get_profile_metrics
+from .batch import SampleBatch
+from .gpu import GpuProcessSampler, join_process_names, load_nvml
 import os
 import tempfile
 
-try:
-    from pynvml import nvmlInit, nvmlDeviceGetCount, nvmlDeviceGetHandleByIndex, nvmlDeviceGetName, nvmlDeviceGetUtilizationRates, nvmlDeviceGetTemperature, NVML_TEMPERATURE_GPU, nvmlDeviceGetFanSpeed, nvmlDeviceGetPowerUsage, NVMLError, nvmlShutdown
-    HAS_NVML = True
-except ImportError:
-    HAS_NVML = False
-
 PID_FILE = os.path.join(tempfile.gettempdir(), "procmon_collector.pid")
 
 MAX_RETRIES = 5
 RETRY_DELAY = 5 # seconds
+COLLECTION_INTERVAL = 5 # seconds
+SKETCH_FLUSH_INTERVAL = 60 # seconds
+CAPTURE_LIFECYCLE = os.getenv("PROCMON_CAPTURE_LIFECYCLE", "1") == "1"
+CAPTURE_GPU_PROCESSES = os.getenv("PROCMON_CAPTURE_GPU_PROCESSES", "1") == "1"
 
 def write_pid_file():
     pid = os.getpid()
@@ -45,34 +52,65 @@ def retry_get_db_connection():
     print("Failed to connect to database after multiple retries. Exiting collector.")
     return None
 
+def _stop_on_sigterm(signum, frame):
+    # stop-collector sends SIGTERM; unwinding like Ctrl+C runs the cleanup in
+    # collect_data, which removes the snapshot and flushes pending sketches.
+    raise KeyboardInterrupt
+
 def collect_data():
     """Collects process data and inserts it into the database."""
+    signal.signal(signal.SIGTERM, _stop_on_sigterm)
+    try:
+        metrics = get_profile_metrics(METRIC_PROFILE)
+        # pynvml, or the scripted fake backend when PROCMON_FAKE_NVML is set.
+        nvml = load_nvml()
+    except ValueError as e:
+        print(f"Configuration error: {e}")
+        return
+    # Only the profile's metrics are inserted; the other columns stay NULL.
+    insert_columns = ", ".join(("pid", "name", "cpu_percent", "memory_percent") + tuple(metrics))
+    insert_query = f"INSERT INTO processes (time, {insert_columns}) VALUES %s"
+    insert_template = f"(NOW(), {', '.join(['%s'] * (4 + len(metrics)))})"
+
     write_pid_file()
     conn = retry_get_db_connection()
     if not conn:
         delete_pid_file()
         return
 
+    sketches = SketchAccumulator()
+    # Reused for every sweep so steady-state sampling does not allocate per process.
+    batch = SampleBatch()
+    last_sketch_flush = time.time()
+    snapshot = None
+    churn_detector = None
+    gpu_sampler = None
+    sampler = None
+
     try:
+        snapshot = SnapshotWriter()
+        if COLLECTOR_WORKERS > 0:
+            sampler = ShardedSampler(COLLECTOR_WORKERS, metrics)
+        else:
+            sampler = ProcessSampler(metrics)
+        if CAPTURE_LIFECYCLE and ProcessChurnDetector.is_supported():
+            churn_detector = ProcessChurnDetector()
+            churn_detector.start()
+        if nvml and CAPTURE_GPU_PROCESSES and GpuProcessSampler.is_supported(nvml):
+            gpu_sampler = GpuProcessSampler(nvml)
+            gpu_sampler.start()
         cur = conn.cursor()
         while True:
-            processes_data = []
-            for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent']):
-                try:
-                    pid = proc.info['pid']
-                    name = proc.info['name']
-                    cpu_percent = proc.info['cpu_percent']
-                    memory_percent = proc.info['memory_percent']
-                    processes_data.append((pid, name, cpu_percent, memory_percent))
-                except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                    pass
+            sweep_time = time.time()
+            batch.clear()
+            sampler.sample(batch)
+            sketches.add_batch(sweep_time, batch)
+
+            snapshot.publish(sweep_time, collect_system_totals(), batch)
             
-            if processes_data:
+            if len(batch):
                 try:
-                    cur.executemany(
-                        "INSERT INTO processes (time, pid, name, cpu_percent, memory_percent) VALUES (NOW(), %s, %s, %s, %s)",
-                        processes_data
-                    )
+                    execute_values(cur, insert_query, batch.rows(metrics), template=insert_template, page_size=1000)
                     conn.commit()
                 except Error as e:
                     print(f"Database error during insertion: {e}")
@@ -84,8 +122,8 @@ def collect_data():
                         break # Exit if reconnection fails
                     cur = conn.cursor() # Get new cursor from new connection
 
-            if HAS_NVML:
-                gpu_data = collect_gpu_data()
+            if nvml:
+                gpu_data = collect_gpu_data(nvml)
                 if gpu_data:
                     try:
                         cur.executemany(
@@ -102,29 +140,140 @@ def collect_data():
                             break
                         cur = conn.cursor()
 
-            time.sleep(5) # Collect data every 5 seconds
+            if gpu_sampler:
+                gpu_process_data = join_process_names(gpu_sampler.drain(), batch)
+                if gpu_process_data:
+                    try:
+                        cur.executemany(
+                            "INSERT INTO gpu_process_usage (time, gpu_index, pid, name, samples, avg_sm_util, max_sm_util, avg_memory_util, max_memory_util, used_memory) VALUES (NOW(), %s, %s, %s, %s, %s, %s, %s, %s, %s)",
+                            gpu_process_data
+                        )
+                        conn.commit()
+                    except Error as e:
+                        print(f"Database error during GPU process insertion: {e}")
+                        conn.rollback()
+                        conn.close()
+                        conn = retry_get_db_connection()
+                        if not conn:
+                            break
+                        cur = conn.cursor()
+
+            if churn_detector:
+                lifecycle_data = churn_detector.drain()
+                if lifecycle_data:
+                    try:
+                        cur.executemany(
+                            "INSERT INTO process_lifecycle (pid, name, start_time, exit_time, cpu_time, max_rss) VALUES (%s, %s, %s, %s, %s, %s)",
+                            lifecycle_data
+                        )
+                        conn.commit()
+                    except Error as e:
+                        print(f"Database error during lifecycle insertion: {e}")
+                        conn.rollback()
+                        conn.close()
+                        conn = retry_get_db_connection()
+                        if not conn:
+                            break
+                        cur = conn.cursor()
+
+            if sweep_time - last_sketch_flush >= SKETCH_FLUSH_INTERVAL:
+                last_sketch_flush = sweep_time
+                try:
+                    flush_sketches(conn, sketches)
+                except Error as e:
+                    print(f"Database error during sketch flush: {e}")
+                    conn.rollback()
+                    conn.close()
+                    conn = retry_get_db_connection()
+                    if not conn:
+                        break
+                    cur = conn.cursor()
+
+            # Keep a steady cadence even when a sweep takes a noticeable part of the interval
+            time.sleep(max(0, COLLECTION_INTERVAL - (time.time() - sweep_time)))
 
     except KeyboardInterrupt:
         print("Data collection stopped.")
     except Exception as e:
         print(f"An unexpected error occurred during data collection: {e}")
     finally:
+        if isinstance(sampler, ShardedSampler):
+            sampler.close()
+        if churn_detector:
+            churn_detector.stop()
+        if gpu_sampler:
+            gpu_sampler.stop()
+        if snapshot:
+            snapshot.close()
         if conn:
+            try:
+                # The stop may have interrupted a statement mid-transaction.
+                conn.rollback()
+                flush_sketches(conn, sketches)
+            except Error as e:
+                print(f"Database error during final sketch flush: {e}")
             conn.close()
         delete_pid_file()
 
-def collect_gpu_data():
+def collect_system_totals():
+    """Returns system-wide totals in the order stored in the snapshot."""
+    mem = psutil.virtual_memory()
+    disk_io = psutil.disk_io_counters()
+    return (
+        psutil.cpu_percent(interval=None),
+        mem.percent,
+        mem.total,
+        mem.used,
+        disk_io.read_bytes if disk_io else 0,
+        disk_io.write_bytes if disk_io else 0
+    )
+
+def flush_sketches(conn, accumulator):
+    """Merges pending percentile sketches into the process_sketches table."""
+    pending = accumulator.drain()
+    if not pending:
+        return
+    try:
+        cur = conn.cursor()
+        buckets = sorted({bucket for bucket, _ in pending})
+        names = sorted({name for _, name in pending})
+        cur.execute(
+            "SELECT bucket, name, cpu_sketch, memory_sketch FROM process_sketches "
+            "WHERE bucket = ANY(%s) AND name = ANY(%s) FOR UPDATE",
+            (buckets, names)
+        )
+        merged = {}
+        for bucket, name, cpu_sketch, memory_sketch in cur.fetchall():
+            if (bucket, name) in pending:
+                merged[(bucket, name)] = (DDSketch.from_bytes(cpu_sketch), DDSketch.from_bytes(memory_sketch))
+        rows = []
+        for key, (cpu, memory) in pending.items():
+            if key in merged:
+                cpu = merged[key][0].merge(cpu)
+                memory = merged[key][1].merge(memory)
+            rows.append((key[0], key[1], cpu.to_bytes(), memory.to_bytes()))
+        cur.executemany(
+            "INSERT INTO process_sketches (bucket, name, cpu_sketch, memory_sketch) VALUES (%s, %s, %s, %s) "
+            "ON CONFLICT (bucket, name) DO UPDATE SET cpu_sketch = EXCLUDED.cpu_sketch, memory_sketch = EXCLUDED.memory_sketch",
+            rows
+        )
+        conn.commit()
+    except Error:
+        accumulator.restore(pending)
+        raise
+
+def collect_gpu_data(nvml):
     gpu_metrics = []
     try:
-        nvmlInit()
-        device_count = nvmlDeviceGetCount()
+        nvml.nvmlInit()
+        device_count = nvml.nvmlDeviceGetCount()
         for i in range(device_count):
-            handle = nvmlDeviceGetHandleByIndex(i)
-            gpu_name = nvmlDeviceGetName(handle)
-            utilization = nvmlDeviceGetUtilizationRates(handle)
-            temperature = nvmlDeviceGetTemperature(handle, NVML_TEMPERATURE_GPU)
-            fan_speed = nvmlDeviceGetFanSpeed(handle)
-            power_usage = nvmlDeviceGetPowerUsage(handle) / 1000 # Convert mW to W
+            handle = nvml.nvmlDeviceGetHandleByIndex(i)
+            gpu_name = nvml.nvmlDeviceGetName(handle)
+            utilization = nvml.nvmlDeviceGetUtilizationRates(handle)
+            temperature = nvml.nvmlDeviceGetTemperature(handle, nvml.NVML_TEMPERATURE_GPU)
+            fan_speed = nvml.nvmlDeviceGetFanSpeed(handle)
+            power_usage = nvml.nvmlDeviceGetPowerUsage(handle) / 1000 # Convert mW to W
 
             gpu_metrics.append((
                 i,
@@ -135,12 +284,12 @@ def collect_gpu_data():
                 fan_speed,
                 power_usage
             ))
-    except NVMLError as error:
+    except nvml.NVMLError as error:
         print(f"NVML Error: {error}")
     finally:
         try:
-            nvmlShutdown()
-        except NVMLError as error:
+            nvml.nvmlShutdown()
+        except nvml.NVMLError as error:
             print(f"NVML Shutdown Error: {error}")
     return gpu_metrics
 
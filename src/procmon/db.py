@@ -30,6 +30,18 @@ def setup_database(conn=None):
                     memory_percent REAL
                 );
             """)
+            # Optional metrics from the standard and full profiles; NULL when not collected.
+            cur.execute("""
+                ALTER TABLE processes
+                    ADD COLUMN IF NOT EXISTS rss BIGINT,
+                    ADD COLUMN IF NOT EXISTS uss BIGINT,
+                    ADD COLUMN IF NOT EXISTS num_threads INTEGER,
+                    ADD COLUMN IF NOT EXISTS num_fds INTEGER,
+                    ADD COLUMN IF NOT EXISTS ctx_switches_voluntary BIGINT,
+                    ADD COLUMN IF NOT EXISTS ctx_switches_involuntary BIGINT,
+                    ADD COLUMN IF NOT EXISTS read_bytes BIGINT,
+                    ADD COLUMN IF NOT EXISTS write_bytes BIGINT;
+            """)
             cur.execute("""
                 CREATE TABLE IF NOT EXISTS gpu_usage (
                     id SERIAL PRIMARY KEY,
@@ -43,6 +55,57 @@ def setup_database(conn=None):
                     power_usage REAL
                 );
             """)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS process_sketches (
+                    bucket TIMESTAMP WITH TIME ZONE NOT NULL,
+                    name VARCHAR(255) NOT NULL,
+                    cpu_sketch BYTEA NOT NULL,
+                    memory_sketch BYTEA NOT NULL,
+                    PRIMARY KEY (bucket, name)
+                );
+            """)
+            # Daily rollups of process_sketches for full UTC days, built by `procmon db maintain`.
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS process_sketches_daily (
+                    bucket TIMESTAMP WITH TIME ZONE NOT NULL,
+                    name VARCHAR(255) NOT NULL,
+                    cpu_sketch BYTEA NOT NULL,
+                    memory_sketch BYTEA NOT NULL,
+                    PRIMARY KEY (bucket, name)
+                );
+            """)
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS process_lifecycle (
+                    id SERIAL PRIMARY KEY,
+                    pid INTEGER,
+                    name VARCHAR(255),
+                    start_time TIMESTAMP WITH TIME ZONE,
+                    exit_time TIMESTAMP WITH TIME ZONE,
+                    cpu_time REAL,
+                    max_rss BIGINT
+                );
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS process_lifecycle_exit_time_idx ON process_lifecycle (exit_time);")
+            cur.execute("""
+                CREATE TABLE IF NOT EXISTS gpu_process_usage (
+                    id SERIAL PRIMARY KEY,
+                    time TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+                    gpu_index INTEGER,
+                    pid INTEGER,
+                    name VARCHAR(255),
+                    samples INTEGER,
+                    avg_sm_util REAL,
+                    max_sm_util REAL,
+                    avg_memory_util REAL,
+                    max_memory_util REAL,
+                    used_memory BIGINT
+                );
+            """)
+            cur.execute("CREATE INDEX IF NOT EXISTS gpu_process_usage_time_idx ON gpu_process_usage (time);")
+            # Retention and `db stats` range-scan these by time. The names match the
+            # indexes create_hypertable adds, so converted tables are not indexed twice.
+            cur.execute("CREATE INDEX IF NOT EXISTS processes_time_idx ON processes (time DESC);")
+            cur.execute("CREATE INDEX IF NOT EXISTS gpu_usage_time_idx ON gpu_usage (time DESC);")
             _conn.commit()
         except Error as e:
             print(f"Error setting up database: {e}")
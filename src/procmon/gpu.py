@@ -0,0 +1,317 @@
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+GPU_SAMPLE_INTERVAL = float(os.getenv("PROCMON_GPU_SAMPLE_INTERVAL", "1.0")) # seconds
+# Path to a JSON script for FakeNvml; replaces pynvml when set.
+FAKE_NVML = os.getenv("PROCMON_FAKE_NVML")
+
+NVML_ERROR_UNINITIALIZED = 1
+NVML_ERROR_INVALID_ARGUMENT = 2
+NVML_ERROR_NOT_FOUND = 6
+
+try:
+    from pynvml import NVMLError
+except ImportError:
+    class NVMLError(Exception):
+        """Mirrors pynvml.NVMLError for machines without pynvml."""
+
+        _messages = {
+            NVML_ERROR_UNINITIALIZED: "Uninitialized",
+            NVML_ERROR_INVALID_ARGUMENT: "Invalid Argument",
+            NVML_ERROR_NOT_FOUND: "Not Found",
+        }
+
+        def __init__(self, value):
+            super().__init__(value)
+            self.value = value
+
+        def __str__(self):
+            return self._messages.get(self.value, f"NVML error {self.value}")
+
+
+def load_nvml():
+    """Returns the NVML backend: FakeNvml if PROCMON_FAKE_NVML is set, else pynvml.
+
+    Returns None when neither is available. Both backends expose the same
+    function names, so callers use ``nvml.nvmlDeviceGetCount()`` and so on.
+    Raises ValueError if the PROCMON_FAKE_NVML script cannot be loaded.
+    """
+    if FAKE_NVML:
+        try:
+            return FakeNvml.from_file(FAKE_NVML)
+        except (OSError, ValueError, KeyError) as e:
+            raise ValueError(f"Cannot load the PROCMON_FAKE_NVML script {FAKE_NVML!r}: {e}") from e
+    try:
+        import pynvml
+    except ImportError:
+        return None
+    return pynvml
+
+
+def nvml_timestamp(nvml) -> int:
+    """Returns the current time on the clock NVML stamps utilization samples with.
+
+    The driver uses CPU wall-clock time in microseconds; FakeNvml uses its
+    own ``clock``.
+    """
+    return int(getattr(nvml, "clock", time.time)() * 1e6)
+
+
+_Utilization = namedtuple("Utilization", "gpu memory")
+_ProcessInfo = namedtuple("ProcessInfo", "pid usedGpuMemory")
+_ProcessUtilizationSample = namedtuple("ProcessUtilizationSample", "pid timeStamp smUtil memUtil encUtil decUtil")
+
+
+class FakeNvml:
+    """A scriptable stand-in for the pynvml module.
+
+    Each device plays a looping timeline of phases. A phase lists the
+    processes on the GPU for ``duration`` seconds with their memory and SM
+    and memory-controller utilization:
+
+        {"sample_period": 0.1667, "devices": [{"name": "Fake GPU", "timeline": [
+            {"duration": 2, "processes": {"1234": {"memory": 1073741824, "sm": 90, "mem": 40}}},
+            {"duration": 8, "processes": {}}
+        ]}]}
+
+    Utilization samples are produced every ``sample_period`` seconds and
+    kept in a ring of ``buffer_size``, like the driver's own buffer.
+    Processes with ``"graphics": true`` are reported as graphics rather
+    than compute processes. ``clock`` can be replaced to drive time in tests.
+    """
+
+    NVML_TEMPERATURE_GPU = 0
+    NVMLError = NVMLError
+
+    def __init__(self, devices, sample_period: float = 1 / 6, buffer_size: int = 100, clock=time.time):
+        self.devices = []
+        for device in devices:
+            timeline = [
+                (float(phase["duration"]), {int(pid): info for pid, info in phase.get("processes", {}).items()})
+                for phase in device.get("timeline", [])
+            ] or [(1.0, {})]
+            self.devices.append(dict(device, timeline=timeline))
+        self.sample_period = sample_period
+        self.buffer_size = buffer_size
+        self.clock = clock
+        self.start = clock()
+        self.init_count = 0
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs):
+        with open(path) as f:
+            script = json.load(f)
+        if "sample_period" in script:
+            kwargs.setdefault("sample_period", script["sample_period"])
+        return cls(script["devices"], **kwargs)
+
+    def _device(self, handle):
+        if not self.init_count:
+            raise NVMLError(NVML_ERROR_UNINITIALIZED)
+        return self.devices[handle]
+
+    def _processes(self, device, at: float):
+        timeline = device["timeline"]
+        elapsed = (at - self.start) % sum(duration for duration, _ in timeline)
+        for duration, processes in timeline:
+            if elapsed < duration:
+                return processes
+            elapsed -= duration
+        return timeline[-1][1]
+
+    def nvmlInit(self):
+        self.init_count += 1
+
+    def nvmlShutdown(self):
+        if not self.init_count:
+            raise NVMLError(NVML_ERROR_UNINITIALIZED)
+        self.init_count -= 1
+
+    def nvmlDeviceGetCount(self):
+        if not self.init_count:
+            raise NVMLError(NVML_ERROR_UNINITIALIZED)
+        return len(self.devices)
+
+    def nvmlDeviceGetHandleByIndex(self, index):
+        if not 0 <= index < self.nvmlDeviceGetCount():
+            raise NVMLError(NVML_ERROR_INVALID_ARGUMENT)
+        return index
+
+    def nvmlDeviceGetName(self, handle):
+        return self._device(handle).get("name", f"Fake GPU {handle}")
+
+    def nvmlDeviceGetUtilizationRates(self, handle):
+        processes = self._processes(self._device(handle), self.clock()).values()
+        return _Utilization(
+            min(100, sum(p.get("sm", 0) for p in processes)),
+            min(100, sum(p.get("mem", 0) for p in processes))
+        )
+
+    def nvmlDeviceGetTemperature(self, handle, sensor):
+        return self._device(handle).get("temperature", 40)
+
+    def nvmlDeviceGetFanSpeed(self, handle):
+        return self._device(handle).get("fan_speed", 30)
+
+    def nvmlDeviceGetPowerUsage(self, handle):
+        return self._device(handle).get("power_usage", 50000) # milliwatts
+
+    def _running_processes(self, handle, graphics: bool):
+        processes = self._processes(self._device(handle), self.clock())
+        return [
+            _ProcessInfo(pid, info.get("memory"))
+            for pid, info in processes.items() if bool(info.get("graphics")) == graphics
+        ]
+
+    def nvmlDeviceGetComputeRunningProcesses(self, handle):
+        return self._running_processes(handle, graphics=False)
+
+    def nvmlDeviceGetGraphicsRunningProcesses(self, handle):
+        return self._running_processes(handle, graphics=True)
+
+    def nvmlDeviceGetProcessUtilization(self, handle, last_seen_timestamp):
+        device = self._device(handle)
+        newest = int((self.clock() - self.start) / self.sample_period)
+        samples = []
+        for k in range(max(0, newest - self.buffer_size + 1), newest + 1):
+            at = self.start + k * self.sample_period
+            timestamp = int(at * 1e6)
+            if timestamp <= last_seen_timestamp:
+                continue
+            for pid, info in self._processes(device, at).items():
+                samples.append(_ProcessUtilizationSample(pid, timestamp, info.get("sm", 0), info.get("mem", 0), 0, 0))
+        if not samples:
+            raise NVMLError(NVML_ERROR_NOT_FOUND)
+        return samples
+
+
+class GpuProcessSampler(threading.Thread):
+    """Attributes GPU memory and utilization to processes between sweeps.
+
+    Every ``interval`` seconds the sampler lists the compute and graphics
+    processes on each device and reads the driver's buffered per-process
+    utilization samples newer than the last one seen, so bursts shorter
+    than a sweep are still counted. Per (gpu, pid) totals accumulate until
+    the collector drains them once per sweep. Samples the driver buffered
+    before the sampler was created are skipped.
+    """
+
+    def __init__(self, nvml, interval: float = GPU_SAMPLE_INTERVAL):
+        super().__init__(name="procmon-gpu", daemon=True)
+        self.nvml = nvml
+        self.interval = interval
+        self._handles = None
+        self._started = nvml_timestamp(nvml)
+        self._last_seen = {}
+        # (gpu_index, pid) -> [samples, sm_sum, sm_max, mem_sum, mem_max, used_memory]
+        self._usage = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    @staticmethod
+    def is_supported(nvml) -> bool:
+        try:
+            nvml.nvmlInit()
+        except nvml.NVMLError:
+            return False
+        try:
+            return nvml.nvmlDeviceGetCount() > 0
+        except nvml.NVMLError:
+            return False
+        finally:
+            nvml.nvmlShutdown()
+
+    def _entry(self, gpu_index, pid):
+        entry = self._usage.get((gpu_index, pid))
+        if entry is None:
+            entry = self._usage[(gpu_index, pid)] = [0, 0.0, 0.0, 0.0, 0.0, None]
+        return entry
+
+    def poll(self):
+        nvml = self.nvml
+        if self._handles is None:
+            nvml.nvmlInit()
+            self._handles = [nvml.nvmlDeviceGetHandleByIndex(i) for i in range(nvml.nvmlDeviceGetCount())]
+
+        for gpu_index, handle in enumerate(self._handles):
+            processes = []
+            for list_processes in (nvml.nvmlDeviceGetComputeRunningProcesses, nvml.nvmlDeviceGetGraphicsRunningProcesses):
+                try:
+                    processes += list_processes(handle)
+                except nvml.NVMLError:
+                    pass
+            try:
+                samples = nvml.nvmlDeviceGetProcessUtilization(handle, self._last_seen.get(gpu_index, self._started))
+            except nvml.NVMLError:
+                # NOT_FOUND: no new samples since the last poll.
+                samples = []
+
+            with self._lock:
+                for process in processes:
+                    entry = self._entry(gpu_index, process.pid)
+                    if process.usedGpuMemory is not None:
+                        entry[5] = max(entry[5] or 0, process.usedGpuMemory)
+                last_seen = self._last_seen.get(gpu_index, self._started)
+                for sample in samples:
+                    if sample.timeStamp <= last_seen:
+                        continue
+                    entry = self._entry(gpu_index, sample.pid)
+                    entry[0] += 1
+                    entry[1] += sample.smUtil
+                    entry[2] = max(entry[2], sample.smUtil)
+                    entry[3] += sample.memUtil
+                    entry[4] = max(entry[4], sample.memUtil)
+                if samples:
+                    self._last_seen[gpu_index] = max(last_seen, max(sample.timeStamp for sample in samples))
+
+    def drain(self):
+        """Returns (gpu_index, pid, samples, avg_sm, max_sm, avg_mem, max_mem, used_memory) since the last drain.
+
+        Processes that held GPU memory without a utilization sample have
+        zero samples and NULL utilization.
+        """
+        with self._lock:
+            usage = self._usage
+            self._usage = {}
+        records = []
+        for (gpu_index, pid), (samples, sm_sum, sm_max, mem_sum, mem_max, used_memory) in sorted(usage.items()):
+            if samples:
+                records.append((gpu_index, pid, samples, sm_sum / samples, sm_max, mem_sum / samples, mem_max, used_memory))
+            else:
+                records.append((gpu_index, pid, 0, None, None, None, None, used_memory))
+        return records
+
+    def run(self):
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    self.poll()
+                except self.nvml.NVMLError as e:
+                    print(f"GPU process sampler error: {e}")
+                self._stop_event.wait(self.interval)
+        finally:
+            if self._handles is not None:
+                self.nvml.nvmlShutdown()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+def join_process_names(records, batch):
+    """Inserts each record's process name from the sweep's batch after its pid.
+
+    Pids the sweep did not see, such as processes in another pid namespace,
+    get a NULL name.
+    """
+    if not records:
+        return []
+    wanted = {record[1] for record in records}
+    names = {}
+    pids, batch_names = batch.pids, batch.names
+    for i in range(len(batch)):
+        if pids[i] in wanted:
+            names[pids[i]] = batch_names[i]
+    return [(gpu_index, pid, names.get(pid), *rest) for gpu_index, pid, *rest in records]
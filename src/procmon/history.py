@@ -3,11 +3,86 @@ from psycopg2 import Error
 from rich.console import Console
 from rich.table import Table
 from .db import get_db_connection
+from .sketch import DDSketch
+from .metrics import METRIC_COLUMNS
 
 import json
 import csv
+from datetime import timedelta
 from io import StringIO
 
+COMPARE_PERCENTILE = 95
+COMPARE_METRICS = ("cpu_avg", "cpu_max", "cpu_p95", "memory_avg", "memory_max", "memory_p95")
+DEFAULT_MIN_CHANGE = 10.0 # percent
+# Baselines below this many percentage points are raised to it, so a process
+# going from 0.1% to 0.3% CPU does not rank as a +200% regression.
+COMPARE_BASELINE_FLOOR = 1.0
+# Names with fewer samples in a window are treated as absent from it.
+MIN_COMPARE_SAMPLES = 12
+
+def build_history_query(
+    process_name: str = None,
+    pid: int = None,
+    start_time: str = None,
+    end_time: str = None,
+    aggregate: str = None,
+    gpu: bool = False,
+    gpu_index: int = None,
+    lifecycle: bool = False,
+    gpu_processes: bool = False,
+    limit: int = 100
+):
+    """Builds the SELECT behind ``query_history`` and returns ``(query, params)``."""
+    time_column = "time"
+    if gpu:
+        table_name = "gpu_usage"
+        columns = "time, gpu_index, gpu_name, utilization_gpu, utilization_memory, temperature_gpu, fan_speed, power_usage"
+        order_by = "time"
+    elif gpu_processes:
+        table_name = "gpu_process_usage"
+        columns = "time, gpu_index, pid, name, samples, avg_sm_util, max_sm_util, avg_memory_util, max_memory_util, used_memory"
+        order_by = "time"
+    elif lifecycle:
+        table_name = "process_lifecycle"
+        columns = "exit_time, pid, name, start_time, cpu_time, max_rss"
+        order_by = "exit_time"
+        time_column = "exit_time"
+    elif aggregate:
+        table_name = f"processes_{aggregate}"
+        columns = "bucket, name, max_cpu_percent, avg_cpu_percent, max_memory_percent, avg_memory_percent"
+        order_by = "bucket"
+    else:
+        table_name = "processes"
+        columns = "time, pid, name, cpu_percent, memory_percent, " + ", ".join(METRIC_COLUMNS)
+        order_by = "time"
+
+    query = f"SELECT {columns} FROM {table_name} WHERE 1=1"
+    params = []
+
+    if gpu or gpu_processes:
+        if gpu_index is not None:
+            query += " AND gpu_index = %s"
+            params.append(gpu_index)
+    if not gpu: # Process specific filters
+        if process_name:
+            query += " AND name ILIKE %s"
+            params.append(f"%{process_name}%")
+        if pid:
+            query += " AND pid = %s"
+            params.append(pid)
+    
+    if start_time:
+        query += f" AND {time_column} >= %s"
+        params.append(start_time)
+    if end_time:
+        query += f" AND {time_column} <= %s"
+        params.append(end_time)
+    
+    query += f" ORDER BY {order_by} DESC LIMIT %s"
+    params.append(limit)
+
+    return query, params
+
 def query_history(
     process_name: str = None,
     pid: int = None,
@@ -16,10 +91,40 @@ def query_history(
     aggregate: str = None,
     output_format: str = 'table',
     gpu: bool = False,
-    gpu_index: int = None
+    gpu_index: int = None,
+    percentiles: str = None,
+    lifecycle: bool = False,
+    gpu_processes: bool = False,
+    compare: tuple = None,
+    min_change: float = DEFAULT_MIN_CHANGE,
+    rank_by: str = "cpu_p95"
 ):
     """Queries historical process data from the database."""
     console = Console()
+
+    if compare:
+        try:
+            windows = [parse_window(window) for window in compare]
+        except ValueError as e:
+            console.print(f"[bold red]Error: {e}[/bold red]")
+            return
+        if rank_by not in COMPARE_METRICS:
+            console.print(f"[bold red]Error: Invalid ranking metric. Choose from {', '.join(COMPARE_METRICS)}.[/bold red]")
+            return
+        if gpu or pid or lifecycle or gpu_processes or aggregate or percentiles or start_time or end_time:
+            console.print("[bold red]Error: --compare takes its own time windows and only combines with --process-name.[/bold red]")
+            return
+
+    if percentiles:
+        try:
+            quantiles = parse_percentiles(percentiles)
+        except ValueError as e:
+            console.print(f"[bold red]Error: {e}[/bold red]")
+            return
+        if gpu or pid or lifecycle or gpu_processes:
+            console.print("[bold red]Error: Percentiles are tracked per process name and cannot be combined with --pid, --gpu, --gpu-processes or --lifecycle.[/bold red]")
+            return
+
     conn = get_db_connection()
     if not conn:
         console.print("[bold red]Error: Could not connect to the database.[/bold red]")
@@ -32,43 +137,15 @@ def query_history(
             console.print("[bold red]Error: Invalid aggregate level. Choose from hourly, daily, weekly, monthly.[/bold red]")
             return
 
-        if gpu:
-            table_name = "gpu_usage"
-            columns = "time, gpu_index, gpu_name, utilization_gpu, utilization_memory, temperature_gpu, fan_speed, power_usage"
-            order_by = "time"
-        elif aggregate:
-            table_name = f"processes_{aggregate}"
-            columns = "bucket, name, max_cpu_percent, avg_cpu_percent, max_memory_percent, avg_memory_percent"
-            order_by = "bucket"
-        else:
-            table_name = "processes"
-            columns = "time, pid, name, cpu_percent, memory_percent"
-            order_by = "time"
-
-        query = f"SELECT {columns} FROM {table_name} WHERE 1=1"
-        params = []
-
-        if gpu:
-            if gpu_index is not None:
-                query += " AND gpu_index = %s"
-                params.append(gpu_index)
-        else: # Process specific filters
-            if process_name:
-                query += " AND name ILIKE %s"
-                params.append(f"%{process_name}%")
-            if pid:
-                query += " AND pid = %s"
-                params.append(pid)
-        
-        if start_time:
-            query += " AND time >= %s"
-            params.append(start_time)
-        if end_time:
-            query += " AND time <= %s"
-            params.append(end_time)
-        
-        query += f" ORDER BY {order_by} DESC LIMIT 100"
+        if percentiles:
+            query_percentiles(console, cur, quantiles, process_name, start_time, end_time, aggregate, output_format)
+            return
 
+        if compare:
+            query_comparison(console, cur, windows, process_name, output_format, rank_by, min_change)
+            return
+
+        query, params = build_history_query(process_name, pid, start_time, end_time, aggregate, gpu, gpu_index, lifecycle, gpu_processes)
         cur.execute(query, params)
         rows = cur.fetchall()
 
@@ -108,6 +185,45 @@ def query_history(
                         f"{row[6]:.2f}",
                         f"{row[7]:.2f}"
                     )
+            elif gpu_processes:
+                table = Table(title="Historical GPU Usage by Process")
+                table.add_column("Timestamp", style="cyan")
+                table.add_column("GPU Index", justify="right", style="cyan")
+                table.add_column("PID", justify="right", style="cyan")
+                table.add_column("PName", style="magenta")
+                table.add_column("Samples", justify="right", style="cyan")
+                table.add_column("Avg SM %", justify="right", style="green")
+                table.add_column("Max SM %", justify="right", style="green")
+                table.add_column("Avg Mem Util %", justify="right", style="yellow")
+                table.add_column("Max Mem Util %", justify="right", style="yellow")
+                table.add_column("GPU Mem MB", justify="right", style="blue")
+                for row in rows:
+                    table.add_row(
+                        str(row[0]),
+                        str(row[1]),
+                        str(row[2]),
+                        str(row[3]),
+                        str(row[4]),
+                        *("-" if value is None else f"{value:.2f}" for value in row[5:9]),
+                        "-" if row[9] is None else f"{row[9]/1024**2:.1f}"
+                    )
+            elif lifecycle:
+                table = Table(title="Short-Lived Processes")
+                table.add_column("Exited", style="cyan")
+                table.add_column("PID", justify="right", style="cyan")
+                table.add_column("PName", style="magenta")
+                table.add_column("Started", style="cyan")
+                table.add_column("CPU Time (s)", justify="right", style="green")
+                table.add_column("Max RSS MB", justify="right", style="yellow")
+                for row in rows:
+                    table.add_row(
+                        str(row[0]),
+                        str(row[1]),
+                        str(row[2]),
+                        str(row[3]),
+                        f"{row[4]:.2f}",
+                        f"{row[5]/1024**2:.1f}"
+                    )
             else:
                 table = Table(title=f"Historical Process Data ({aggregate if aggregate else 'Raw'})")
                 if aggregate:
@@ -123,6 +239,13 @@ def query_history(
                     table.add_column("PName", style="magenta")
                     table.add_column("CPU %", justify="right", style="green")
                     table.add_column("Memory %", justify="right", style="yellow")
+                    # Only show the optional metrics the collector's profile recorded.
+                    metric_positions = [
+                        5 + i for i, metric in enumerate(METRIC_COLUMNS)
+                        if any(row[5 + i] is not None for row in rows)
+                    ]
+                    for position in metric_positions:
+                        table.add_column(METRIC_LABELS[METRIC_COLUMNS[position - 5]], justify="right", style="blue")
 
                 for row in rows:
                     if aggregate:
@@ -140,7 +263,8 @@ def query_history(
                             str(row[1]),
                             str(row[2]),
                             f"{row[3]:.2f}",
-                            f"{row[4]:.2f}"
+                            f"{row[4]:.2f}",
+                            *(_format_metric(METRIC_COLUMNS[position - 5], row[position]) for position in metric_positions)
                         )
             
             console.print(table)
@@ -150,3 +274,296 @@ def query_history(
     finally:
         conn.close()
 
+
+AGGREGATE_TRUNC_UNITS = {"hourly": "hour", "daily": "day", "weekly": "week", "monthly": "month"}
+
+METRIC_LABELS = {
+    "rss": "RSS MB",
+    "uss": "USS MB",
+    "num_threads": "Threads",
+    "num_fds": "FDs",
+    "ctx_switches_voluntary": "Vol Ctx Sw",
+    "ctx_switches_involuntary": "Invol Ctx Sw",
+    "read_bytes": "Read MB",
+    "write_bytes": "Write MB",
+}
+BYTE_METRICS = {"rss", "uss", "read_bytes", "write_bytes"}
+
+def _format_metric(metric: str, value) -> str:
+    if value is None:
+        return "N/A"
+    if metric in BYTE_METRICS:
+        return f"{value/1024**2:.1f}"
+    return str(value)
+
+def parse_percentiles(value: str):
+    """Parses a comma separated list like "95,99" into sorted percentiles."""
+    try:
+        result = sorted({float(p) for p in value.split(",") if p.strip()})
+    except ValueError:
+        raise ValueError(f"Invalid percentile list: {value!r}")
+    if not result or any(p <= 0 or p > 100 for p in result):
+        raise ValueError("Percentiles must be greater than 0 and at most 100.")
+    return result
+
+def _format_percentile(p: float) -> str:
+    return f"p{p:g}"
+
+def query_percentiles(console, cur, percentiles, process_name, start_time, end_time, aggregate, output_format):
+    """Answers percentile queries by merging the stored sketches.
+
+    Full UTC days are read from the daily rollups unless the results are
+    bucketed hourly; everything else comes from the hourly sketches.
+    """
+    trunc_unit = AGGREGATE_TRUNC_UNITS.get(aggregate)
+    bucket_expr = "date_trunc(%s, bucket, 'UTC')" if trunc_unit else "NULL"
+    source, source_params = _sketch_source(cur, [(start_time, end_time)], daily=trunc_unit != "hour")
+    query = f"SELECT {bucket_expr}, name, cpu_sketch, memory_sketch FROM {source} AS sketches WHERE 1=1"
+    params = ([trunc_unit] if trunc_unit else []) + source_params
+
+    if process_name:
+        query += " AND name ILIKE %s"
+        params.append(f"%{process_name}%")
+
+    cur.execute(query, params)
+
+    merged = {}
+    while True:
+        batch = cur.fetchmany(1000)
+        if not batch:
+            break
+        for bucket, name, cpu_sketch, memory_sketch in batch:
+            sketches = merged.get((bucket, name))
+            if sketches is None:
+                merged[(bucket, name)] = (DDSketch.from_bytes(cpu_sketch), DDSketch.from_bytes(memory_sketch))
+            else:
+                sketches[0].merge_bytes(cpu_sketch)
+                sketches[1].merge_bytes(memory_sketch)
+
+    if not merged:
+        console.print("[bold yellow]No percentile data found for the given criteria.[/bold yellow]")
+        return
+
+    top = percentiles[-1] / 100
+
+    def cpu_rank(key):
+        # Names whose CPU was never readable have an empty CPU sketch; they rank last.
+        value = merged[key][0].quantile(top)
+        return -1.0 if value is None else value
+
+    if trunc_unit:
+        keys = sorted(merged, key=lambda k: (k[0], cpu_rank(k)), reverse=True)
+    else:
+        keys = sorted(merged, key=cpu_rank, reverse=True)
+    keys = keys[:100]
+
+    columns = (["bucket"] if trunc_unit else []) + ["name", "samples"]
+    columns += [f"cpu_{_format_percentile(p)}" for p in percentiles]
+    columns += [f"memory_{_format_percentile(p)}" for p in percentiles]
+    rows = []
+    for bucket, name in keys:
+        cpu, memory = merged[(bucket, name)]
+        row = ([bucket] if trunc_unit else []) + [name, max(cpu.count, memory.count)]
+        row += [cpu.quantile(p / 100) for p in percentiles]
+        row += [memory.quantile(p / 100) for p in percentiles]
+        rows.append(row)
+
+    if output_format == 'json':
+        result = [dict(zip(columns, row)) for row in rows]
+        console.print(json.dumps(result, indent=4, default=str))
+    elif output_format == 'csv':
+        output = StringIO()
+        writer = csv.writer(output)
+        writer.writerow(columns)
+        writer.writerows(rows)
+        console.print(output.getvalue())
+    else:
+        table = Table(title=f"Process Percentiles ({aggregate if aggregate else 'Whole Range'})")
+        if trunc_unit:
+            table.add_column("Time Bucket", style="cyan")
+        table.add_column("PName", style="magenta")
+        table.add_column("Samples", justify="right", style="cyan")
+        for p in percentiles:
+            table.add_column(f"CPU % {_format_percentile(p)}", justify="right", style="green")
+        for p in percentiles:
+            table.add_column(f"Memory % {_format_percentile(p)}", justify="right", style="yellow")
+        offset = 1 if trunc_unit else 0
+        for row in rows:
+            cells = [str(value) for value in row[:offset + 2]]
+            cells += ["N/A" if value is None else f"{value:.2f}" for value in row[offset + 2:]]
+            table.add_row(*cells)
+        console.print(table)
+
+def parse_window(value: str):
+    """Parses a "start..end" window into its two bounds."""
+    start, sep, end = value.partition("..")
+    if not sep or not start.strip() or not end.strip():
+        raise ValueError(f"Invalid window {value!r}; expected \"start..end\", e.g. \"2024-01-01..2024-01-08\".")
+    return start.strip(), end.strip()
+
+def _summarize(cpu: DDSketch, memory: DDSketch, rank_by: str):
+    q = COMPARE_PERCENTILE / 100
+    return {
+        "samples": (cpu if rank_by.startswith("cpu_") else memory).count,
+        "cpu_avg": cpu.avg, "cpu_max": cpu.max, "cpu_p95": cpu.quantile(q),
+        "memory_avg": memory.avg, "memory_max": memory.max, "memory_p95": memory.quantile(q),
+    }
+
+def compare_windows(merged, rank_by: str = "cpu_p95", min_change: float = DEFAULT_MIN_CHANGE, min_samples: int = MIN_COMPARE_SAMPLES):
+    """Builds the comparison rows from per-window sketches.
+
+    ``merged`` maps ``(window, name)`` to ``(cpu_sketch, memory_sketch)``,
+    with window 0 for A and 1 for B. Names present in both windows are kept
+    when ``rank_by`` moved by at least ``min_change`` percent and ranked by
+    that change, largest increase first; names only present in one window
+    follow as "new" or "gone".
+    """
+    names = sorted({name for _, name in merged})
+    changed, new, gone = [], [], []
+    for name in names:
+        summaries = []
+        for window in (0, 1):
+            sketches = merged.get((window, name))
+            # The sketch rank_by reads can be empty when that metric was denied.
+            ranked = sketches and sketches[0 if rank_by.startswith("cpu_") else 1]
+            summaries.append(_summarize(*sketches, rank_by) if ranked and ranked.count >= min_samples else None)
+        a, b = summaries
+        if a is None and b is None:
+            continue
+        row = {"name": name, "samples_a": a["samples"] if a else 0, "samples_b": b["samples"] if b else 0}
+        for metric in COMPARE_METRICS:
+            row[f"{metric}_a"] = a[metric] if a else None
+            row[f"{metric}_b"] = b[metric] if b else None
+        if a and b:
+            change = (b[rank_by] - a[rank_by]) / max(a[rank_by], COMPARE_BASELINE_FLOOR) * 100
+            if abs(change) < min_change:
+                continue
+            row.update(change_percent=change, status="changed")
+            changed.append(row)
+        elif b:
+            row.update(change_percent=None, status="new")
+            new.append(row)
+        else:
+            row.update(change_percent=None, status="gone")
+            gone.append(row)
+    changed.sort(key=lambda row: row["change_percent"], reverse=True)
+    new.sort(key=lambda row: row[f"{rank_by}_b"], reverse=True)
+    gone.sort(key=lambda row: row[f"{rank_by}_a"], reverse=True)
+    return changed + new + gone
+
+def _sketch_source(cur, windows, daily=True):
+    """Splits ``(start, end)`` windows into rolled-up days and hourly ranges.
+
+    Returns a subquery of ``(label, bucket, name, cpu_sketch, memory_sketch)``
+    rows, labelled by window index, and its parameters. Buckets starting at
+    or after ``start`` and before ``end`` are covered; a missing bound means
+    the oldest sketch or now. Full UTC days with a rollup are read from
+    process_sketches_daily when ``daily`` is set, and the hours around them
+    from process_sketches.
+    """
+    values = ", ".join(f"({label}, %s::timestamptz, %s::timestamptz)" for label in range(len(windows)))
+    cur.execute(
+        "SELECT w.label, w.start_time, w.end_time, ARRAY("
+        "SELECT day FROM generate_series(date_trunc('day', w.start_time, 'UTC'), w.end_time, interval '24 hours') AS day "
+        "WHERE day >= w.start_time AND day + interval '24 hours' <= w.end_time "
+        "AND EXISTS (SELECT 1 FROM process_sketches_daily d WHERE d.bucket = day) ORDER BY day) "
+        "FROM (SELECT label, COALESCE(start_time, (SELECT LEAST("
+        "(SELECT min(bucket) FROM process_sketches), (SELECT min(bucket) FROM process_sketches_daily)))), "
+        f"COALESCE(end_time, now()) FROM (VALUES {values}) AS v(label, start_time, end_time)) "
+        "AS w(label, start_time, end_time)",
+        [bound for window in windows for bound in window]
+    )
+    day_labels, days, range_labels, range_starts, range_ends = [], [], [], [], []
+    for window, start, end, rolled_up in cur.fetchall():
+        if start is None:
+            # No sketches stored at all.
+            continue
+        for day in rolled_up if daily else []:
+            day_labels.append(window)
+            days.append(day)
+            if day > start:
+                range_labels.append(window)
+                range_starts.append(start)
+                range_ends.append(day)
+            start = day + timedelta(days=1)
+        if start < end:
+            range_labels.append(window)
+            range_starts.append(start)
+            range_ends.append(end)
+
+    source = (
+        "(SELECT r.label, d.bucket, d.name, d.cpu_sketch, d.memory_sketch FROM process_sketches_daily d "
+        "JOIN unnest(%s::int[], %s::timestamptz[]) AS r(label, day) ON d.bucket = r.day "
+        "UNION ALL "
+        "SELECT r.label, s.bucket, s.name, s.cpu_sketch, s.memory_sketch FROM process_sketches s "
+        "JOIN unnest(%s::int[], %s::timestamptz[], %s::timestamptz[]) AS r(label, start_time, end_time) "
+        "ON s.bucket >= r.start_time AND s.bucket < r.end_time)"
+    )
+    return source, [day_labels, days, range_labels, range_starts, range_ends]
+
+def query_comparison(console, cur, windows, process_name, output_format, rank_by, min_change):
+    """Compares two time windows per process name over the stored sketches.
+
+    Full UTC days inside a window are read from the daily rollups, so a
+    week is 7 sketches per name instead of 168; the hours around them, and
+    days not rolled up yet, come from the hourly sketches.
+    """
+    (a_start, a_end), (b_start, b_end) = windows
+    source, params = _sketch_source(cur, windows)
+    # One row per (window, name); a bucket inside both windows is counted in each.
+    query = f"SELECT label, name, array_agg(cpu_sketch), array_agg(memory_sketch) FROM {source} AS sketches"
+    if process_name:
+        query += " WHERE name ILIKE %s"
+        params.append(f"%{process_name}%")
+    query += " GROUP BY label, name"
+    cur.execute(query, params)
+
+    merged = {}
+    while True:
+        batch = cur.fetchmany(1000)
+        if not batch:
+            break
+        for window, name, cpu_sketches, memory_sketches in batch:
+            cpu, memory = DDSketch(), DDSketch()
+            for data in cpu_sketches:
+                cpu.merge_bytes(data)
+            for data in memory_sketches:
+                memory.merge_bytes(data)
+            merged[(window, name)] = (cpu, memory)
+
+    rows = compare_windows(merged, rank_by, min_change)[:100]
+    if not rows:
+        console.print("[bold yellow]No significant changes between the two windows.[/bold yellow]")
+        return
+
+    if output_format == 'json':
+        console.print(json.dumps(rows, indent=4, default=str))
+    elif output_format == 'csv':
+        output = StringIO()
+        writer = csv.DictWriter(output, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+        console.print(output.getvalue())
+    else:
+        def pair(row, metric):
+            a, b = row[f"{metric}_a"], row[f"{metric}_b"]
+            return f"{'-' if a is None else f'{a:.2f}'} → {'-' if b is None else f'{b:.2f}'}"
+
+        table = Table(title=f"Window Comparison by {rank_by} ({a_start}..{a_end} vs {b_start}..{b_end})")
+        table.add_column("PName", style="magenta")
+        table.add_column("Samples A", justify="right", style="cyan")
+        table.add_column("Samples B", justify="right", style="cyan")
+        for metric in COMPARE_METRICS:
+            label = metric.replace("cpu_", "CPU % ").replace("memory_", "Memory % ")
+            table.add_column(label, justify="right", style="green" if metric.startswith("cpu") else "yellow")
+        table.add_column("Change", justify="right", style="red")
+        for row in rows:
+            change = row["status"] if row["change_percent"] is None else f"{row['change_percent']:+.1f}%"
+            table.add_row(
+                row["name"],
+                str(row["samples_a"]),
+                str(row["samples_b"]),
+                *(pair(row, metric) for metric in COMPARE_METRICS),
+                change
+            )
+        console.print(table)
@@ -0,0 +1,149 @@
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import psutil
+
+PROC_ROOT = "/proc"
+CHURN_INTERVAL = float(os.getenv("PROCMON_CHURN_INTERVAL", "0.2")) # seconds
+# Processes that live longer than this are left to the regular sweep.
+CHURN_WINDOW = float(os.getenv("PROCMON_CHURN_WINDOW", "10")) # seconds
+# Fraction of one core the detector may spend polling; large process tables
+# are polled less often than CHURN_INTERVAL to stay under it.
+CHURN_MAX_LOAD = float(os.getenv("PROCMON_CHURN_MAX_LOAD", "0.1"))
+
+
+def parse_stat(data: bytes):
+    """Parses /proc/<pid>/stat into (name, start_ticks, cpu_ticks, rss_pages).
+
+    The command name is wrapped in parentheses and may itself contain spaces
+    or parentheses, so the remaining fields are split after the last ')'.
+    """
+    open_paren = data.index(b"(")
+    close_paren = data.rindex(b")")
+    name = data[open_paren + 1:close_paren].decode("utf-8", "replace")
+    fields = data[close_paren + 2:].split()
+    # fields[0] is field 3 (state) in proc(5) numbering.
+    cpu_ticks = int(fields[11]) + int(fields[12])
+    start_ticks = int(fields[19])
+    rss_pages = int(fields[21])
+    return name, start_ticks, cpu_ticks, rss_pages
+
+
+class ProcessChurnDetector(threading.Thread):
+    """Captures processes that start and exit between collector sweeps.
+
+    The detector diffs the pid directories in /proc every ``interval``
+    seconds. New pids have their stat file re-read on every tick so the
+    final CPU time and peak RSS are known when they disappear. Finished
+    processes are queued until the collector drains them in a batch.
+
+    Listing /proc costs time per pid, so when a poll takes longer than
+    ``max_load`` of the interval the next one is delayed accordingly;
+    processes shorter than the stretched interval may then be missed.
+    """
+
+    def __init__(self, proc_root: str = PROC_ROOT, interval: float = CHURN_INTERVAL, window: float = CHURN_WINDOW,
+                 max_load: float = CHURN_MAX_LOAD):
+        super().__init__(name="procmon-churn", daemon=True)
+        self.proc_root = proc_root
+        self.interval = interval
+        self.window = window
+        self.max_load = max_load
+        self.clock_ticks = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+        self.page_size = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+        self.boot_time = psutil.boot_time()
+        self._known = None
+        # pid -> [name, start_ticks, cpu_ticks, max_rss_pages, first_seen]
+        self._tracked = {}
+        self._records = []
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    @staticmethod
+    def is_supported(proc_root: str = PROC_ROOT) -> bool:
+        return os.path.isdir(proc_root)
+
+    def _list_pids(self):
+        with os.scandir(self.proc_root) as entries:
+            return {int(entry.name) for entry in entries if entry.name.isdigit()}
+
+    def _read_stat(self, pid):
+        try:
+            with open(f"{self.proc_root}/{pid}/stat", "rb") as f:
+                return parse_stat(f.read())
+        except (OSError, ValueError, IndexError):
+            return None
+
+    def _record(self, pid, tracked, now):
+        name, start_ticks, cpu_ticks, max_rss_pages, _ = tracked
+        self._records.append((
+            pid,
+            name,
+            datetime.fromtimestamp(self.boot_time + start_ticks / self.clock_ticks, tz=timezone.utc),
+            datetime.fromtimestamp(now, tz=timezone.utc),
+            cpu_ticks / self.clock_ticks,
+            max_rss_pages * self.page_size
+        ))
+
+    def poll(self, now: float = None):
+        now = time.time() if now is None else now
+        pids = self._list_pids()
+        if self._known is None:
+            # The first listing is the baseline; those processes are already
+            # visible to the regular sweep.
+            self._known = pids
+            return
+
+        with self._lock:
+            for pid in self._known - pids:
+                tracked = self._tracked.pop(pid, None)
+                if tracked:
+                    self._record(pid, tracked, now)
+
+            for pid, tracked in list(self._tracked.items()):
+                if now - tracked[4] > self.window:
+                    del self._tracked[pid]
+                    continue
+                stat = self._read_stat(pid)
+                if stat is None:
+                    continue
+                name, start_ticks, cpu_ticks, rss_pages = stat
+                if start_ticks != tracked[1]:
+                    # The pid was reused between two ticks.
+                    self._record(pid, tracked, now)
+                    self._tracked[pid] = [name, start_ticks, cpu_ticks, rss_pages, now]
+                else:
+                    tracked[2] = cpu_ticks
+                    tracked[3] = max(tracked[3], rss_pages)
+
+            for pid in pids - self._known:
+                stat = self._read_stat(pid)
+                if stat is not None:
+                    self._tracked[pid] = [*stat, now]
+
+        self._known = pids
+
+    def drain(self):
+        """Returns the processes that exited since the last drain."""
+        with self._lock:
+            records = self._records
+            self._records = []
+        return records
+
+    def next_interval(self, poll_seconds: float) -> float:
+        """Seconds to wait after a poll that took ``poll_seconds``."""
+        return max(self.interval, poll_seconds * (1 / self.max_load - 1))
+
+    def run(self):
+        while not self._stop_event.is_set():
+            start = time.perf_counter()
+            try:
+                self.poll()
+            except OSError as e:
+                print(f"Process churn detector error: {e}")
+            self._stop_event.wait(self.next_interval(time.perf_counter() - start))
+
+    def stop(self):
+        self._stop_event.set()
@@ -0,0 +1,447 @@
+import json
+import os
+
+from psycopg2 import Error
+from psycopg2.extras import execute_values
+from rich.console import Console
+from rich.progress import Progress
+from rich.table import Table
+
+from .db import get_db_connection
+from .sketch import DDSketch
+
+RETENTION = os.getenv("PROCMON_RETENTION", "30 days")
+SKETCH_RETENTION = os.getenv("PROCMON_SKETCH_RETENTION", "365 days")
+COMPRESS_AFTER = os.getenv("PROCMON_COMPRESS_AFTER", "7 days")
+REFRESH_WINDOW = os.getenv("PROCMON_REFRESH_WINDOW", "7 days")
+# Rows removed per DELETE when applying retention to plain tables.
+RETENTION_BATCH_SIZE = int(os.getenv("PROCMON_RETENTION_BATCH_SIZE", "10000"))
+
+# Table name -> time column used for retention and ingest rate.
+TABLES = {
+    "processes": "time",
+    "gpu_usage": "time",
+    "gpu_process_usage": "time",
+    "process_lifecycle": "exit_time",
+    "process_sketches": "bucket",
+    "process_sketches_daily": "bucket",
+}
+# Kept for SKETCH_RETENTION instead of RETENTION.
+SKETCH_TABLES = ("process_sketches", "process_sketches_daily")
+# Days before the newest rollup that are rechecked for late hourly sketches.
+ROLLUP_LOOKBACK = os.getenv("PROCMON_ROLLUP_LOOKBACK", "2 days")
+REORDER_INDEX = "processes_name_time_idx"
+
+
+def _has_timescaledb(cur):
+    cur.execute("SELECT extversion FROM pg_extension WHERE extname = 'timescaledb'")
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def _hypertables(cur):
+    """Returns {hypertable_name: compression_enabled}."""
+    cur.execute("SELECT hypertable_name, compression_enabled FROM timescaledb_information.hypertables WHERE hypertable_schema = current_schema()")
+    return dict(cur.fetchall())
+
+
+def _existing_tables(cur, names):
+    cur.execute("SELECT c.relname FROM pg_class c WHERE c.relname = ANY(%s) AND c.relkind IN ('r', 'p', 'v', 'm') AND pg_table_is_visible(c.oid)", (list(names),))
+    return {row[0] for row in cur.fetchall()}
+
+
+def _leading_index_column(cur, table_name, column):
+    """Whether some index on the table starts with the column."""
+    cur.execute("""
+        SELECT EXISTS (
+            SELECT 1 FROM pg_index i
+            JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = i.indkey[0]
+            WHERE i.indrelid = %s::regclass AND a.attname = %s
+        )
+    """, (table_name, column))
+    return cur.fetchone()[0]
+
+
+def _human_bytes(value):
+    if value is None:
+        return "N/A"
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if abs(value) < 1024 or unit == "TB":
+            return f"{value:.1f} {unit}" if unit != "B" else f"{value} B"
+        value /= 1024
+
+
+def collect_db_stats(cur):
+    """Gathers storage statistics for every procmon table."""
+    timescale_version = _has_timescaledb(cur)
+    hypertables = _hypertables(cur) if timescale_version else {}
+    existing = _existing_tables(cur, TABLES)
+    stats = {"timescaledb": timescale_version, "tables": [], "chunks": [], "aggregates": []}
+
+    for table_name, time_column in TABLES.items():
+        if table_name not in existing:
+            continue
+        if table_name in hypertables:
+            cur.execute("SELECT hypertable_size(%s), approximate_row_count(%s)", (table_name, table_name))
+        else:
+            cur.execute("SELECT pg_total_relation_size(%s), GREATEST(reltuples, 0)::bigint FROM pg_class WHERE oid = %s::regclass", (table_name, table_name))
+        total_bytes, row_count = cur.fetchone()
+
+        # Counting recent rows is only cheap with an index on the time column;
+        # plain tables without one would need a full scan, so the rate is skipped.
+        rows_per_second = None
+        if _leading_index_column(cur, table_name, time_column):
+            cur.execute(f"SELECT count(*) FROM {table_name} WHERE {time_column} > now() - interval '10 minutes'")
+            rows_per_second = cur.fetchone()[0] / 600
+
+        entry = {
+            "table": table_name,
+            "hypertable": table_name in hypertables,
+            "total_bytes": total_bytes,
+            "row_count": row_count,
+            "rows_per_second": rows_per_second,
+            "bytes_per_day": rows_per_second * 86400 * total_bytes / row_count if row_count and rows_per_second is not None else None,
+            "before_compression_bytes": None,
+            "after_compression_bytes": None,
+            "compression_ratio": None,
+        }
+        if hypertables.get(table_name):
+            cur.execute("SELECT sum(before_compression_total_bytes), sum(after_compression_total_bytes) FROM hypertable_compression_stats(%s)", (table_name,))
+            before, after = cur.fetchone()
+            entry["before_compression_bytes"] = before
+            entry["after_compression_bytes"] = after
+            entry["compression_ratio"] = before / after if before and after else None
+        stats["tables"].append(entry)
+
+        if table_name in hypertables:
+            cur.execute("""
+                SELECT c.chunk_name, c.range_start, c.range_end, c.is_compressed, s.total_bytes, GREATEST(pc.reltuples, 0)::bigint
+                FROM timescaledb_information.chunks c
+                LEFT JOIN chunks_detailed_size(%s) s ON s.chunk_name = c.chunk_name AND s.chunk_schema = c.chunk_schema
+                LEFT JOIN pg_class pc ON pc.relname = c.chunk_name AND pc.relnamespace = c.chunk_schema::regnamespace
+                WHERE c.hypertable_name = %s
+                ORDER BY c.range_start
+            """, (table_name, table_name))
+            chunks = cur.fetchall()
+            compression = {}
+            if hypertables.get(table_name):
+                # A compressed chunk's heap is empty; its row count is recorded when it is compressed.
+                cur.execute("""
+                    SELECT cs.chunk_name, cs.before_compression_total_bytes, cs.after_compression_total_bytes, sz.numrows_pre_compression
+                    FROM chunk_compression_stats(%s) cs
+                    LEFT JOIN _timescaledb_catalog.chunk ch ON ch.schema_name = cs.chunk_schema AND ch.table_name = cs.chunk_name
+                    LEFT JOIN _timescaledb_catalog.compression_chunk_size sz ON sz.chunk_id = ch.id
+                """, (table_name,))
+                compression = {row[0]: row[1:] for row in cur.fetchall()}
+            for chunk_name, range_start, range_end, is_compressed, chunk_bytes, chunk_rows in chunks:
+                before, after, compressed_rows = compression.get(chunk_name, (None, None, None))
+                stats["chunks"].append({
+                    "table": table_name,
+                    "chunk": chunk_name,
+                    "range_start": range_start,
+                    "range_end": range_end,
+                    "compressed": is_compressed,
+                    "total_bytes": chunk_bytes,
+                    "row_count": compressed_rows if is_compressed and compressed_rows is not None else chunk_rows,
+                    "before_compression_bytes": before,
+                    "after_compression_bytes": after,
+                    "compression_ratio": before / after if before and after else None,
+                })
+
+    if timescale_version:
+        cur.execute("""
+            SELECT ca.view_name, max(s.last_successful_finish), now() - max(s.last_successful_finish)
+            FROM timescaledb_information.continuous_aggregates ca
+            LEFT JOIN timescaledb_information.jobs j
+                ON j.hypertable_schema = ca.materialization_hypertable_schema
+                AND j.hypertable_name = ca.materialization_hypertable_name
+            LEFT JOIN timescaledb_information.job_stats s ON s.job_id = j.job_id
+            WHERE ca.view_schema = current_schema()
+            GROUP BY ca.view_name
+            ORDER BY ca.view_name
+        """)
+        for view_name, last_refresh, refresh_lag in cur.fetchall():
+            cur.execute(f"SELECT now() - max(bucket) FROM {view_name}")
+            data_lag = cur.fetchone()[0]
+            stats["aggregates"].append({
+                "view": view_name,
+                "last_refresh": last_refresh,
+                "refresh_lag": refresh_lag,
+                "data_lag": data_lag,
+            })
+
+    return stats
+
+
+def show_db_stats(output_format: str = 'table'):
+    """Prints per-table and per-chunk storage statistics."""
+    console = Console()
+    conn = get_db_connection()
+    if not conn:
+        console.print("[bold red]Error: Could not connect to the database.[/bold red]")
+        return
+
+    try:
+        stats = collect_db_stats(conn.cursor())
+    except Error as e:
+        console.print(f"[bold red]Database error: {e}[/bold red]")
+        return
+    finally:
+        conn.close()
+
+    if output_format == 'json':
+        console.print(json.dumps(stats, indent=4, default=str))
+        return
+
+    if not stats["timescaledb"]:
+        console.print("[bold yellow]TimescaleDB extension not installed; chunk, compression and aggregate stats are unavailable.[/bold yellow]")
+
+    table = Table(title="Table Storage")
+    table.add_column("Table", style="magenta")
+    table.add_column("Hypertable", style="cyan")
+    table.add_column("Size", justify="right", style="green")
+    table.add_column("Rows (est.)", justify="right", style="green")
+    table.add_column("Ingest rows/s", justify="right", style="yellow")
+    table.add_column("Growth/day", justify="right", style="yellow")
+    table.add_column("Compression", justify="right", style="blue")
+    for entry in stats["tables"]:
+        ratio = entry["compression_ratio"]
+        table.add_row(
+            entry["table"],
+            "yes" if entry["hypertable"] else "no",
+            _human_bytes(entry["total_bytes"]),
+            f"{entry['row_count']:,}",
+            f"{entry['rows_per_second']:.1f}" if entry["rows_per_second"] is not None else "N/A",
+            _human_bytes(int(entry["bytes_per_day"])) if entry["bytes_per_day"] is not None else "N/A",
+            f"{ratio:.1f}x" if ratio else "N/A"
+        )
+    console.print(table)
+
+    if stats["chunks"]:
+        chunk_table = Table(title="Chunks")
+        chunk_table.add_column("Table", style="magenta")
+        chunk_table.add_column("Chunk", style="cyan")
+        chunk_table.add_column("Range Start", style="cyan")
+        chunk_table.add_column("Range End", style="cyan")
+        chunk_table.add_column("Compressed", style="blue")
+        chunk_table.add_column("Size", justify="right", style="green")
+        chunk_table.add_column("Rows (est.)", justify="right", style="green")
+        chunk_table.add_column("Compression", justify="right", style="blue")
+        for chunk in stats["chunks"]:
+            chunk_table.add_row(
+                chunk["table"],
+                chunk["chunk"],
+                str(chunk["range_start"]),
+                str(chunk["range_end"]),
+                "yes" if chunk["compressed"] else "no",
+                _human_bytes(chunk["total_bytes"]),
+                f"{chunk['row_count']:,}" if chunk["row_count"] is not None else "N/A",
+                f"{chunk['compression_ratio']:.1f}x" if chunk["compression_ratio"] else "N/A"
+            )
+        console.print(chunk_table)
+
+    if stats["aggregates"]:
+        aggregate_table = Table(title="Continuous Aggregates")
+        aggregate_table.add_column("View", style="magenta")
+        aggregate_table.add_column("Last Refresh", style="cyan")
+        aggregate_table.add_column("Refresh Lag", justify="right", style="yellow")
+        aggregate_table.add_column("Data Lag", justify="right", style="yellow")
+        for aggregate in stats["aggregates"]:
+            aggregate_table.add_row(
+                aggregate["view"],
+                str(aggregate["last_refresh"] or "never"),
+                str(aggregate["refresh_lag"] or "N/A"),
+                str(aggregate["data_lag"] or "N/A")
+            )
+        console.print(aggregate_table)
+
+
+def _delete_expired(cur, table_name, time_column, keep, batch_size=RETENTION_BATCH_SIZE):
+    """Deletes rows older than ``keep`` in batches, oldest first, then vacuums the table.
+
+    Each batch commits on its own (the connection is in autocommit), so
+    locks and WAL stay bounded and the collector keeps inserting meanwhile.
+    Every batch starts its index scan at the newest time the previous one
+    deleted, so it does not wade through the dead tuples left behind.
+    Returns the number of rows deleted.
+    """
+    cur.execute("SELECT now() - %s::interval", (keep,))
+    cutoff = cur.fetchone()[0]
+    deleted, lower = 0, None
+    while True:
+        cur.execute(f"""
+            WITH batch AS (
+                DELETE FROM {table_name} WHERE ctid = ANY(ARRAY(
+                    SELECT ctid FROM {table_name}
+                    WHERE {time_column} < %s AND {time_column} >= COALESCE(%s::timestamptz, '-infinity')
+                    ORDER BY {time_column} LIMIT %s
+                ))
+                RETURNING {time_column}
+            )
+            SELECT count(*), max({time_column}) FROM batch
+        """, (cutoff, lower, batch_size))
+        count, newest = cur.fetchone()
+        deleted += count
+        if count < batch_size:
+            break
+        lower = newest
+    if deleted:
+        cur.execute(f"VACUUM (ANALYZE) {table_name}")
+    return deleted
+
+
+def _pending_rollup_days(cur):
+    """UTC days with hourly sketches but no daily rollup for some name.
+
+    Only days that ended more than an hour ago are returned, so the
+    collector has flushed their last hour. Days older than ROLLUP_LOOKBACK
+    before the newest rollup are assumed done, so each run scans only the
+    recent hourly sketches instead of the whole table.
+    """
+    cur.execute("""
+        SELECT DISTINCT date_trunc('day', s.bucket, 'UTC')
+        FROM process_sketches s
+        WHERE s.bucket < date_trunc('day', now() - interval '1 hour', 'UTC')
+            AND s.bucket >= COALESCE((SELECT max(bucket) FROM process_sketches_daily) - %s::interval, '-infinity')
+            AND NOT EXISTS (
+                SELECT 1 FROM process_sketches_daily d
+                WHERE d.bucket = date_trunc('day', s.bucket, 'UTC') AND d.name = s.name
+            )
+        ORDER BY 1
+    """, (ROLLUP_LOOKBACK,))
+    return [row[0] for row in cur.fetchall()]
+
+
+def rollup_sketches(cur, day):
+    """Merges one UTC day of hourly sketches into process_sketches_daily.
+
+    Returns the number of names rolled up. Rerunning a day rebuilds it.
+    """
+    cur.execute(
+        "SELECT name, cpu_sketch, memory_sketch FROM process_sketches "
+        "WHERE bucket >= %s AND bucket < %s + interval '24 hours'",
+        (day, day)
+    )
+    merged = {}
+    while True:
+        batch = cur.fetchmany(1000)
+        if not batch:
+            break
+        for name, cpu_sketch, memory_sketch in batch:
+            sketches = merged.get(name)
+            if sketches is None:
+                merged[name] = (DDSketch.from_bytes(cpu_sketch), DDSketch.from_bytes(memory_sketch))
+            else:
+                sketches[0].merge_bytes(cpu_sketch)
+                sketches[1].merge_bytes(memory_sketch)
+    # One statement per page, so the day is not committed row by row under autocommit.
+    execute_values(
+        cur,
+        "INSERT INTO process_sketches_daily (bucket, name, cpu_sketch, memory_sketch) VALUES %s "
+        "ON CONFLICT (bucket, name) DO UPDATE SET cpu_sketch = EXCLUDED.cpu_sketch, memory_sketch = EXCLUDED.memory_sketch",
+        [(day, name, cpu.to_bytes(), memory.to_bytes()) for name, (cpu, memory) in merged.items()],
+        page_size=1000
+    )
+    return len(merged)
+
+
+def run_maintenance(
+    retention: str = RETENTION,
+    sketch_retention: str = SKETCH_RETENTION,
+    compress_after: str = COMPRESS_AFTER,
+    refresh_window: str = REFRESH_WINDOW,
+    drop: bool = True,
+    reorder: bool = True,
+    compress: bool = True,
+    refresh: bool = True,
+    rollup: bool = True
+):
+    """Applies retention, rolls up daily sketches, reorders and compresses chunks, and refreshes aggregates.
+
+    Steps that need TimescaleDB are skipped on plain PostgreSQL tables;
+    retention then falls back to deleting expired rows.
+    """
+    console = Console()
+    conn = get_db_connection()
+    if not conn:
+        console.print("[bold red]Error: Could not connect to the database.[/bold red]")
+        return
+
+    # Chunk operations and refresh_continuous_aggregate cannot run inside a transaction block.
+    conn.autocommit = True
+    try:
+        cur = conn.cursor()
+        timescale_version = _has_timescaledb(cur)
+        hypertables = _hypertables(cur) if timescale_version else {}
+        existing = _existing_tables(cur, TABLES)
+        if not timescale_version:
+            console.print("[bold yellow]TimescaleDB extension not installed; only retention and the sketch rollup will be applied.[/bold yellow]")
+
+        with Progress(console=console) as progress:
+            if drop:
+                task = progress.add_task("Applying retention", total=len(existing))
+                for table_name, time_column in TABLES.items():
+                    if table_name not in existing:
+                        continue
+                    keep = sketch_retention if table_name in SKETCH_TABLES else retention
+                    if table_name in hypertables:
+                        cur.execute("SELECT count(*) FROM drop_chunks(%s, older_than => %s::interval)", (table_name, keep))
+                        progress.console.print(f"{table_name}: dropped {cur.fetchone()[0]} chunks older than {keep}")
+                    else:
+                        deleted = _delete_expired(cur, table_name, time_column, keep)
+                        progress.console.print(f"{table_name}: deleted {deleted} rows older than {keep}")
+                    progress.advance(task)
+
+            if rollup and {"process_sketches", "process_sketches_daily"} <= existing:
+                days = _pending_rollup_days(cur)
+                task = progress.add_task("Rolling up daily sketches", total=len(days))
+                for day in days:
+                    names = rollup_sketches(cur, day)
+                    progress.console.print(f"process_sketches_daily: rolled up {names} names for {day:%Y-%m-%d}")
+                    progress.advance(task)
+            elif rollup:
+                progress.console.print("[yellow]Skipping sketch rollup: run 'procmon setup-db' to create process_sketches_daily.[/yellow]")
+
+            if reorder and "processes" in hypertables:
+                cur.execute(f"CREATE INDEX IF NOT EXISTS {REORDER_INDEX} ON processes (name, time DESC)")
+                # Skip compressed chunks and the newest chunk, which is still being written.
+                cur.execute("""
+                    SELECT format('%I.%I', chunk_schema, chunk_name)
+                    FROM timescaledb_information.chunks
+                    WHERE hypertable_name = 'processes' AND NOT is_compressed
+                        AND range_end < (SELECT max(range_end) FROM timescaledb_information.chunks WHERE hypertable_name = 'processes')
+                    ORDER BY range_start
+                """)
+                chunks = [row[0] for row in cur.fetchall()]
+                task = progress.add_task("Reordering chunks by (name, time)", total=len(chunks))
+                for chunk in chunks:
+                    cur.execute("SELECT reorder_chunk(%s, %s)", (chunk, REORDER_INDEX))
+                    progress.advance(task)
+            elif reorder:
+                progress.console.print("[yellow]Skipping reorder: processes is not a hypertable.[/yellow]")
+
+            if compress and "processes" in hypertables:
+                if not hypertables["processes"]:
+                    cur.execute("ALTER TABLE processes SET (timescaledb.compress, timescaledb.compress_segmentby = 'name', timescaledb.compress_orderby = 'time DESC')")
+                cur.execute("SELECT show_chunks('processes', older_than => %s::interval)", (compress_after,))
+                chunks = [row[0] for row in cur.fetchall()]
+                task = progress.add_task("Compressing chunks", total=len(chunks))
+                for chunk in chunks:
+                    cur.execute("SELECT compress_chunk(%s, if_not_compressed => true)", (chunk,))
+                    progress.advance(task)
+            elif compress:
+                progress.console.print("[yellow]Skipping compression: processes is not a hypertable.[/yellow]")
+
+            if refresh and timescale_version:
+                cur.execute("SELECT view_name FROM timescaledb_information.continuous_aggregates WHERE view_schema = current_schema() ORDER BY view_name")
+                views = [row[0] for row in cur.fetchall()]
+                task = progress.add_task("Refreshing aggregates", total=len(views))
+                for view_name in views:
+                    cur.execute("CALL refresh_continuous_aggregate(%s, now() - %s::interval, now())", (view_name, refresh_window))
+                    progress.advance(task)
+
+        console.print("[bold green]Maintenance complete.[/bold green]")
+    except Error as e:
+        console.print(f"[bold red]Database error: {e}[/bold red]")
+    finally:
+        conn.close()
@@ -0,0 +1,136 @@
+import os
+
+import psutil
+
+METRIC_PROFILE = os.getenv("PROCMON_METRIC_PROFILE", "standard")
+
+# Optional per-process metrics, in the order they appear in sample rows and
+# in the processes table. Metrics outside the active profile are None.
+METRIC_COLUMNS = (
+    "rss",
+    "uss",
+    "num_threads",
+    "num_fds",
+    "ctx_switches_voluntary",
+    "ctx_switches_involuntary",
+    "read_bytes",
+    "write_bytes",
+)
+ROW_FIELDS = ("pid", "name", "cpu_percent", "memory_percent") + METRIC_COLUMNS
+
+PROFILES = {
+    # CPU and memory percent only: stat and statm.
+    "minimal": (),
+    # Adds status (threads) and io.
+    "standard": ("rss", "num_threads", "read_bytes", "write_bytes"),
+    # Adds smaps_rollup (uss), the fd directory and context switches.
+    "full": METRIC_COLUMNS,
+}
+
+_TOTAL_MEMORY = psutil.virtual_memory().total
+
+
+def get_profile_metrics(profile: str = METRIC_PROFILE):
+    """Returns the metric columns collected by ``profile``."""
+    try:
+        return PROFILES[profile]
+    except KeyError:
+        raise ValueError(f"Unknown metric profile {profile!r}. Choose from {', '.join(PROFILES)}.")
+
+
+def sample_process(proc: psutil.Process, metrics):
+    """Samples one process, reading each /proc file at most once.
+
+    Returns a tuple ordered like ROW_FIELDS. Attributes the process denies
+    access to are None, so the row is still recorded. Raises the usual
+    psutil exceptions if the process disappears.
+    """
+    values = dict.fromkeys(METRIC_COLUMNS)
+    name = cpu_percent = memory_percent = None
+    with proc.oneshot():
+        try:
+            name = proc.name()
+        except psutil.AccessDenied:
+            pass
+        try:
+            cpu_percent = proc.cpu_percent()
+        except psutil.AccessDenied:
+            pass
+        memory = None
+        if "uss" in metrics:
+            try:
+                memory = proc.memory_full_info()
+                values["uss"] = memory.uss
+            except psutil.AccessDenied:
+                pass
+        if memory is None:
+            try:
+                memory = proc.memory_info()
+            except psutil.AccessDenied:
+                pass
+        if memory is not None:
+            # Same as Process.memory_percent(), without reading memory info twice.
+            memory_percent = memory.rss / _TOTAL_MEMORY * 100
+            if "rss" in metrics:
+                values["rss"] = memory.rss
+        if "num_threads" in metrics:
+            try:
+                values["num_threads"] = proc.num_threads()
+            except psutil.AccessDenied:
+                pass
+        if "num_fds" in metrics:
+            try:
+                values["num_fds"] = proc.num_fds() if hasattr(proc, "num_fds") else proc.num_handles()
+            except psutil.AccessDenied:
+                pass
+        if "ctx_switches_voluntary" in metrics or "ctx_switches_involuntary" in metrics:
+            try:
+                ctx_switches = proc.num_ctx_switches()
+                values["ctx_switches_voluntary"] = ctx_switches.voluntary
+                values["ctx_switches_involuntary"] = ctx_switches.involuntary
+            except psutil.AccessDenied:
+                pass
+        if "read_bytes" in metrics or "write_bytes" in metrics:
+            try:
+                io_counters = proc.io_counters()
+                values["read_bytes"] = io_counters.read_bytes
+                values["write_bytes"] = io_counters.write_bytes
+            except (psutil.AccessDenied, AttributeError):
+                pass
+    return (proc.pid, name, cpu_percent, memory_percent, *values.values())
+
+
+class ProcessSampler:
+    """Samples processes into a SampleBatch, keeping one psutil.Process per pid.
+
+    Reusing the Process objects keeps the previous CPU times that
+    ``cpu_percent`` needs. Entries for pids that have exited are pruned on
+    every sweep so the cache never outgrows the live process table. With
+    ``shard_count`` > 1 only pids where ``pid % shard_count == shard`` are
+    sampled, which is how ShardedSampler splits the work.
+    """
+
+    def __init__(self, metrics, shard: int = 0, shard_count: int = 1):
+        self.metrics = metrics
+        self.shard = shard
+        self.shard_count = shard_count
+        self.processes = {}
+
+    def sample(self, batch):
+        processes = self.processes
+        alive = set()
+        for pid in psutil.pids():
+            if self.shard_count > 1 and pid % self.shard_count != self.shard:
+                continue
+            proc = processes.get(pid)
+            try:
+                if proc is None:
+                    proc = processes[pid] = psutil.Process(pid)
+                batch.append(*sample_process(proc, self.metrics))
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                continue
+            alive.add(pid)
+        if len(processes) > len(alive):
+            for pid in processes.keys() - alive:
+                del processes[pid]
+        return batch
@@ -0,0 +1,373 @@
+"""Local HTTP API serving history queries and the live snapshot as JSON.
+
+    GET /history?name=&pid=&start=&end=&aggregate=&gpu=&gpu_index=&lifecycle=&gpu_processes=&limit=
+    GET /snapshot?processes=1
+    GET /health
+
+History rows stream back as a chunked JSON array while the database cursor
+is still being read. Identical requests that arrive while one is in flight
+share its query and receive the same bytes.
+"""
+import asyncio
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import suppress
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from psycopg2 import DataError, Error, OperationalError
+from psycopg2.pool import ThreadedConnectionPool
+
+from .db import DATABASE_URL
+from .history import AGGREGATE_TRUNC_UNITS, build_history_query
+from .snapshot import SNAPSHOT_FILE, read_snapshot
+
+SERVE_HOST = os.getenv("PROCMON_SERVE_HOST", "127.0.0.1")
+SERVE_PORT = int(os.getenv("PROCMON_SERVE_PORT", "8765"))
+POOL_SIZE = int(os.getenv("PROCMON_SERVE_POOL_SIZE", "8"))
+DEFAULT_HISTORY_LIMIT = 100
+MAX_HISTORY_LIMIT = 100000
+FETCH_SIZE = 1000
+MAX_HEADERS = 100
+
+REASONS = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Method Not Allowed",
+    500: "Internal Server Error",
+    503: "Service Unavailable",
+}
+FLAG_VALUES = {"1": True, "true": True, "yes": True, "0": False, "false": False, "no": False, "": False}
+HISTORY_PARAMS = ("name", "pid", "start", "end", "aggregate", "gpu", "gpu_index", "lifecycle", "gpu_processes", "limit")
+
+
+class HttpError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _single(params: dict, key: str):
+    values = params.get(key)
+    if not values:
+        return None
+    if len(values) > 1:
+        raise HttpError(400, f"Parameter '{key}' given more than once.")
+    return values[0]
+
+def _int_param(params: dict, key: str, minimum: int = None, maximum: int = None):
+    value = _single(params, key)
+    if value is None:
+        return None
+    try:
+        number = int(value)
+    except ValueError:
+        raise HttpError(400, f"Parameter '{key}' must be an integer.")
+    if minimum is not None and number < minimum:
+        raise HttpError(400, f"Parameter '{key}' must be at least {minimum}.")
+    if maximum is not None and number > maximum:
+        raise HttpError(400, f"Parameter '{key}' must be at most {maximum}.")
+    return number
+
+def _flag_param(params: dict, key: str) -> bool:
+    value = _single(params, key)
+    if value is None:
+        return False
+    if value.lower() not in FLAG_VALUES:
+        raise HttpError(400, f"Parameter '{key}' must be a boolean.")
+    return FLAG_VALUES[value.lower()]
+
+def parse_history_params(query: str) -> tuple:
+    """Validates a /history query string.
+
+    Returns the ``build_history_query`` arguments as a tuple, which doubles
+    as the key identical requests are coalesced on.
+    """
+    params = parse_qs(query, keep_blank_values=True)
+    unknown = sorted(set(params) - set(HISTORY_PARAMS))
+    if unknown:
+        raise HttpError(400, f"Unknown parameter(s): {', '.join(unknown)}.")
+
+    aggregate = _single(params, "aggregate") or None
+    if aggregate and aggregate not in AGGREGATE_TRUNC_UNITS:
+        raise HttpError(400, f"Invalid aggregate level. Choose from {', '.join(AGGREGATE_TRUNC_UNITS)}.")
+    gpu = _flag_param(params, "gpu")
+    lifecycle = _flag_param(params, "lifecycle")
+    gpu_processes = _flag_param(params, "gpu_processes")
+    if sum(map(bool, (aggregate, gpu, lifecycle, gpu_processes))) > 1:
+        raise HttpError(400, "Choose at most one of 'aggregate', 'gpu', 'lifecycle' and 'gpu_processes'.")
+
+    limit = _int_param(params, "limit", 1, MAX_HISTORY_LIMIT)
+    return (
+        _single(params, "name") or None,
+        _int_param(params, "pid", 1),
+        _single(params, "start") or None,
+        _single(params, "end") or None,
+        aggregate,
+        gpu,
+        _int_param(params, "gpu_index", 0),
+        lifecycle,
+        gpu_processes,
+        limit or DEFAULT_HISTORY_LIMIT,
+    )
+
+
+class _Broadcast:
+    """The chunks of one in-flight response, replayed to every request sharing it."""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def _wake(self):
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def publish(self, chunk: bytes):
+        self.chunks.append(chunk)
+        self._wake()
+
+    def finish(self, error: Exception = None):
+        self.done = True
+        self.error = error
+        self._wake()
+
+    async def stream(self):
+        self.subscribers += 1
+        try:
+            sent = 0
+            while True:
+                changed = self._changed
+                if sent < len(self.chunks):
+                    sent += 1
+                    yield self.chunks[sent - 1]
+                elif self.done:
+                    if self.error:
+                        raise self.error
+                    return
+                else:
+                    await changed.wait()
+        finally:
+            self.subscribers -= 1
+
+
+class QueryServer:
+    """Serves the HTTP API from one asyncio loop.
+
+    Database work runs on a thread pool the size of the connection pool, so
+    every query holds exactly one pooled connection and never blocks the loop.
+    The connection pool is opened on the first history request, which lets
+    /snapshot and /health work without a database.
+    """
+
+    def __init__(self, pool_size: int = POOL_SIZE, snapshot_path: str = SNAPSHOT_FILE, pool=None):
+        self.pool_size = pool_size
+        self.snapshot_path = snapshot_path
+        self.in_flight = {}
+        self._pool = pool
+        self._pool_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix="procmon-db")
+
+    def _get_pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadedConnectionPool(1, self.pool_size, DATABASE_URL)
+            return self._pool
+
+    def _run_history(self, filters: tuple, emit):
+        """Runs one history query on a pooled connection, emitting JSON chunks."""
+        pool = self._get_pool()
+        conn = pool.getconn()
+        try:
+            query, params = build_history_query(*filters)
+            # A named cursor keeps the result set on the server and fetches it in pages.
+            with conn.cursor(name="procmon_serve") as cur:
+                cur.execute(query, params)
+                columns = None
+                prefix = b"["
+                while True:
+                    rows = cur.fetchmany(FETCH_SIZE)
+                    if not rows:
+                        break
+                    if columns is None:
+                        columns = [desc[0] for desc in cur.description]
+                    emit(prefix + ",".join(json.dumps(dict(zip(columns, row)), default=str) for row in rows).encode())
+                    prefix = b","
+            emit(b"[]" if prefix == b"[" else b"]")
+        finally:
+            with suppress(Error):
+                conn.rollback()
+            pool.putconn(conn, close=bool(conn.closed))
+
+    def _read_snapshot(self, include_processes: bool, emit):
+        snapshot = read_snapshot(self.snapshot_path, include_processes=include_processes)
+        if snapshot is None:
+            raise HttpError(503, "No collector snapshot available. Is the collector running?")
+        emit(json.dumps(snapshot).encode())
+
+    async def _produce(self, key, broadcast: _Broadcast, executor, producer, *args):
+        loop = asyncio.get_running_loop()
+
+        def emit(chunk):
+            loop.call_soon_threadsafe(broadcast.publish, chunk)
+
+        try:
+            await loop.run_in_executor(executor, producer, *args, emit)
+        except Exception as e:
+            broadcast.finish(e)
+        else:
+            broadcast.finish()
+        finally:
+            del self.in_flight[key]
+
+    def _coalesce(self, key, executor, producer, *args) -> _Broadcast:
+        """Joins the in-flight request for ``key``, or starts one."""
+        broadcast = self.in_flight.get(key)
+        if broadcast is None:
+            broadcast = self.in_flight[key] = _Broadcast()
+            broadcast.task = asyncio.ensure_future(self._produce(key, broadcast, executor, producer, *args))
+        return broadcast
+
+    async def _dispatch(self, method: str, target: str, writer, keep_alive: bool) -> bool:
+        """Answers one request; returns False if the connection must be closed."""
+        url = urlsplit(target)
+        path = unquote(url.path).rstrip("/") or "/"
+        if path not in ("/history", "/snapshot", "/health"):
+            raise HttpError(404, f"Unknown endpoint '{path}'.")
+        if method != "GET":
+            raise HttpError(405, "Only GET is supported.")
+
+        if path == "/health":
+            body = json.dumps({"status": "ok", "in_flight": len(self.in_flight)}).encode()
+            await self._send(writer, 200, body, keep_alive)
+            return keep_alive
+
+        if path == "/snapshot":
+            params = parse_qs(url.query, keep_blank_values=True)
+            include_processes = _flag_param(params, "processes")
+            broadcast = self._coalesce(("snapshot", include_processes), None, self._read_snapshot, include_processes)
+            body = b"".join([chunk async for chunk in broadcast.stream()])
+            await self._send(writer, 200, body, keep_alive)
+            return keep_alive
+
+        filters = parse_history_params(url.query)
+        broadcast = self._coalesce(("history",) + filters, self._executor, self._run_history, filters)
+        chunks = broadcast.stream()
+        # Wait for the first chunk before committing to a status line, so
+        # connection and query errors still get a proper error response.
+        first = await anext(chunks)
+        writer.write(self._head(200, {"Transfer-Encoding": "chunked"}, keep_alive))
+        try:
+            chunk = first
+            while chunk is not None:
+                writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                await writer.drain()
+                chunk = await anext(chunks, None)
+        except ConnectionError:
+            raise
+        except Exception as e:
+            # Too late for an error status: drop the connection so the client
+            # sees a truncated body instead of a valid-looking partial array.
+            print(f"History stream failed: {e}")
+            return False
+        finally:
+            await chunks.aclose()
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        return keep_alive
+
+    @staticmethod
+    def _head(status: int, headers: dict, keep_alive: bool) -> bytes:
+        lines = [f"HTTP/1.1 {status} {REASONS[status]}", "Content-Type: application/json"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode()
+
+    async def _send(self, writer, status: int, body: bytes, keep_alive: bool):
+        writer.write(self._head(status, {"Content-Length": len(body)}, keep_alive))
+        writer.write(body)
+        await writer.drain()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request_line = await reader.readline()
+                    if not request_line:
+                        break
+                    parts = request_line.decode("latin-1").split()
+                    if len(parts) != 3 or not parts[2].startswith("HTTP/"):
+                        raise HttpError(400, "Malformed request line.")
+                    method, target, version = parts
+                    headers = {}
+                    while True:
+                        line = await reader.readline()
+                        if line in (b"\r\n", b"\n", b""):
+                            break
+                        if len(headers) >= MAX_HEADERS:
+                            raise HttpError(400, "Too many headers.")
+                        name, _, value = line.decode("latin-1").partition(":")
+                        headers[name.strip().lower()] = value.strip()
+                except ValueError:
+                    raise HttpError(400, "Request line or header too long.")
+
+                connection = headers.get("connection", "").lower()
+                keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+                # Requests with a body are never expected; close rather than parse it.
+                if headers.get("content-length", "0") != "0" or "transfer-encoding" in headers:
+                    keep_alive = False
+                try:
+                    keep_alive = await self._dispatch(method, target, writer, keep_alive)
+                except HttpError as e:
+                    await self._send(writer, e.status, json.dumps({"error": e.message}).encode(), keep_alive)
+                except DataError as e:
+                    await self._send(writer, 400, json.dumps({"error": str(e).strip()}).encode(), keep_alive)
+                except OperationalError as e:
+                    await self._send(writer, 503, json.dumps({"error": f"Database unavailable: {str(e).strip()}"}).encode(), keep_alive)
+                except Error as e:
+                    await self._send(writer, 500, json.dumps({"error": f"Database error: {str(e).strip()}"}).encode(), keep_alive)
+                if not keep_alive:
+                    break
+        except HttpError as e:
+            with suppress(ConnectionError):
+                await self._send(writer, e.status, json.dumps({"error": e.message}).encode(), False)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+            with suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def start(self, host: str = SERVE_HOST, port: int = SERVE_PORT):
+        """Starts listening and returns the ``asyncio.Server``."""
+        return await asyncio.start_server(self._handle, host, port)
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._pool is not None:
+            self._pool.closeall()
+
+
+def serve(host: str = SERVE_HOST, port: int = SERVE_PORT, pool_size: int = POOL_SIZE):
+    """Runs the API server until interrupted."""
+    server = QueryServer(pool_size=pool_size)
+
+    async def run():
+        listener = await server.start(host, port)
+        print(f"Serving procmon API on http://{host}:{listener.sockets[0].getsockname()[1]}")
+        async with listener:
+            await listener.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print("Server stopped.")
+    finally:
+        server.close()
@@ -0,0 +1,166 @@
+import multiprocessing
+import os
+import struct
+from multiprocessing import shared_memory
+
+from .batch import SampleBatch
+from .metrics import METRIC_COLUMNS, ProcessSampler
+
+COLLECTOR_WORKERS = int(os.getenv("PROCMON_COLLECTOR_WORKERS", "0"))
+INITIAL_SHARD_CAPACITY = 4096
+
+# Numeric columns of one sampled process; names travel separately because
+# they rarely change for a pid. Metrics that were not collected are -1.
+_ROW = struct.Struct(f"<Iff{len(METRIC_COLUMNS)}q")
+# Marks pids whose name has not been sent yet; None is a valid name.
+_UNSENT = object()
+
+
+def _worker_main(conn, shard, shard_count, metrics, source_factory):
+    # Shards are assigned by pid % shard_count so a pid always lands on the
+    # same worker, which keeps its psutil.Process and therefore the previous
+    # CPU sample needed by cpu_percent.
+    source = source_factory(metrics, shard, shard_count)
+    batch = SampleBatch(INITIAL_SHARD_CAPACITY)
+    shm = shared_memory.SharedMemory(create=True, size=INITIAL_SHARD_CAPACITY * _ROW.size)
+    names = {}
+    # The coordinator attaches to the segment once it learns its name.
+    announce = True
+    try:
+        while conn.recv():
+            batch.clear()
+            source.sample(batch)
+            count = len(batch)
+            if count * _ROW.size > shm.size:
+                shm.close()
+                shm.unlink()
+                shm = shared_memory.SharedMemory(create=True, size=2 * count * _ROW.size)
+                announce = True
+            buf = shm.buf
+            pids, cpu, memory, metric_columns = batch.pids, batch.cpu, batch.memory, batch.metrics
+            new_names = {}
+            for i in range(count):
+                pid = pids[i]
+                _ROW.pack_into(buf, i * _ROW.size, pid, cpu[i], memory[i], *(column[i] for column in metric_columns))
+                name = batch.names[i]
+                if names.get(pid, _UNSENT) != name:
+                    names[pid] = new_names[pid] = name
+            gone = []
+            if len(names) > count:
+                alive = set(pids[:count])
+                gone = [pid for pid in names if pid not in alive]
+                for pid in gone:
+                    del names[pid]
+            conn.send((count, new_names, gone, shm.name if announce else None))
+            announce = False
+    except (EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+class ShardedSampler:
+    """Samples the process table with a pool of worker processes.
+
+    Every sweep asks all workers to sample their shard in parallel. Workers
+    write numeric columns into their own shared memory segment and only send
+    pid-name changes over the pipe, so the coordinator merges the shards
+    without unpickling one object per process.
+    """
+
+    def __init__(self, workers: int, metrics, source_factory=ProcessSampler):
+        self._context = multiprocessing.get_context("spawn")
+        self._shard_count = workers
+        self._metrics = metrics
+        self._source_factory = source_factory
+        # In-process sources that stand in for a crashed worker's shard.
+        self._fallbacks = {}
+        self._workers = [self._start_worker(shard) for shard in range(workers)]
+
+    def _start_worker(self, shard: int):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(child_conn, shard, self._shard_count, self._metrics, self._source_factory),
+            name=f"procmon-shard-{shard}",
+            daemon=True
+        )
+        process.start()
+        child_conn.close()
+        return [process, parent_conn, None, {}]
+
+    def _replace_worker(self, shard: int, batch):
+        """Restarts a dead worker and samples its shard in-process for this sweep."""
+        process, conn, shm, _ = self._workers[shard]
+        process.join(timeout=1)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+        print(f"Sampling worker for shard {shard} died (exit code {process.exitcode}); restarting it.")
+        conn.close()
+        if shm:
+            # The worker could not clean up after itself.
+            shm.close()
+            try:
+                shm.unlink()
+            except FileNotFoundError:
+                pass
+        try:
+            self._workers[shard] = self._start_worker(shard)
+        except OSError as e:
+            print(f"Could not restart the worker for shard {shard}: {e}")
+            self._workers[shard] = [process, conn, None, {}]
+        fallback = self._fallbacks.get(shard)
+        if fallback is None:
+            fallback = self._fallbacks[shard] = self._source_factory(self._metrics, shard, self._shard_count)
+        fallback.sample(batch)
+
+    def sample(self, batch):
+        """Appends every worker's samples to ``batch``.
+
+        A shard whose worker has died is sampled in-process for that sweep
+        and its worker is restarted for the next one.
+        """
+        requested = []
+        for _, conn, _, _ in self._workers:
+            try:
+                conn.send(True)
+                requested.append(True)
+            except OSError:
+                requested.append(False)
+        for shard, worker in enumerate(self._workers):
+            process, conn, shm, names = worker
+            try:
+                if not requested[shard]:
+                    raise EOFError
+                count, new_names, gone, shm_name = conn.recv()
+            except (EOFError, OSError):
+                self._replace_worker(shard, batch)
+                continue
+            if shm_name:
+                if shm:
+                    shm.close()
+                shm = worker[2] = shared_memory.SharedMemory(name=shm_name, track=False)
+            for pid in gone:
+                names.pop(pid, None)
+            names.update(new_names)
+            if count:
+                for pid, cpu_percent, memory_percent, *values in _ROW.iter_unpack(shm.buf[:count * _ROW.size]):
+                    batch.append(pid, names[pid], cpu_percent, memory_percent, *values)
+        return batch
+
+    def close(self):
+        for process, conn, shm, _ in self._workers:
+            try:
+                conn.send(False)
+            except OSError:
+                pass
+            conn.close()
+            if shm:
+                shm.close()
+        for process, _, _, _ in self._workers:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        self._workers = []
@@ -0,0 +1,198 @@
+import math
+import struct
+from datetime import datetime, timezone
+
+from .batch import MISSING
+
+# Relative accuracy of quantile estimates: any returned value is within 1% of
+# the true sample at that rank.
+DEFAULT_RELATIVE_ACCURACY = 0.01
+# Values below this are counted in a dedicated zero bucket (idle processes).
+MIN_INDEXABLE_VALUE = 1e-4
+MAX_BINS = 2048
+
+_HEADER = struct.Struct("<BdQQdddI")
+_BIN = struct.Struct("<hI")
+_FORMAT_VERSION = 1
+
+
+class DDSketch:
+    """A mergeable quantile sketch with bounded relative error.
+
+    Values are mapped to logarithmically sized bins, so merging two sketches
+    is just adding bin counts. Quantiles are answered from the bins and are
+    guaranteed to be within ``relative_accuracy`` of the exact sample value.
+    """
+
+    def __init__(self, relative_accuracy: float = DEFAULT_RELATIVE_ACCURACY):
+        if not 0 < relative_accuracy < 1:
+            raise ValueError("relative_accuracy must be between 0 and 1")
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.bins = {}
+        self.zero_count = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+        self.sum = 0.0
+
+    def _key(self, value: float) -> int:
+        return math.ceil(math.log(value) / self._log_gamma)
+
+    def _value(self, key: int) -> float:
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value: float, weight: int = 1):
+        if value is None:
+            return
+        if value < MIN_INDEXABLE_VALUE:
+            self.zero_count += weight
+        else:
+            key = self._key(value)
+            self.bins[key] = self.bins.get(key, 0) + weight
+            if len(self.bins) > MAX_BINS:
+                self._collapse()
+        self.count += weight
+        self.sum += value * weight
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def _collapse(self):
+        # Fold the lowest bins together; high percentiles stay accurate.
+        keys = sorted(self.bins)
+        excess = len(keys) - MAX_BINS
+        folded = sum(self.bins.pop(k) for k in keys[:excess + 1])
+        self.bins[keys[excess]] = folded
+
+    def merge(self, other: "DDSketch"):
+        if other.count == 0:
+            return self
+        if not math.isclose(other.gamma, self.gamma):
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        for key, count in other.bins.items():
+            self.bins[key] = self.bins.get(key, 0) + count
+        if len(self.bins) > MAX_BINS:
+            self._collapse()
+        self.zero_count += other.zero_count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    @property
+    def avg(self):
+        return self.sum / self.count if self.count else None
+
+    def quantile(self, q: float):
+        """Returns the estimated value at quantile ``q`` (0 <= q <= 1)."""
+        if not 0 <= q <= 1:
+            raise ValueError("q must be between 0 and 1")
+        if self.count == 0:
+            return None
+        rank = math.floor(q * (self.count - 1))
+        if rank < self.zero_count:
+            return max(self.min, 0.0)
+        seen = self.zero_count
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                return min(max(self._value(key), self.min), self.max)
+        return self.max
+
+    def to_bytes(self) -> bytes:
+        parts = [_HEADER.pack(
+            _FORMAT_VERSION, self.relative_accuracy, self.count, self.zero_count,
+            self.min if self.count else 0.0, self.max if self.count else 0.0,
+            self.sum, len(self.bins)
+        )]
+        parts.extend(_BIN.pack(key, count) for key, count in sorted(self.bins.items()))
+        return b"".join(parts)
+
+    def merge_bytes(self, data) -> "DDSketch":
+        """Merges a serialized sketch without building an intermediate object.
+
+        Used when folding many stored sketches together, where decoding each
+        one into a DDSketch first would dominate the cost.
+        """
+        version, accuracy, count, zero_count, vmin, vmax, vsum, nbins = _HEADER.unpack_from(data)
+        if version != _FORMAT_VERSION:
+            raise ValueError(f"Unsupported sketch format version: {version}")
+        if not count:
+            return self
+        if not math.isclose(accuracy, self.relative_accuracy):
+            raise ValueError("Cannot merge sketches with different relative accuracy")
+        bins = self.bins
+        for key, bin_count in _BIN.iter_unpack(memoryview(data)[_HEADER.size:_HEADER.size + nbins * _BIN.size]):
+            bins[key] = bins.get(key, 0) + bin_count
+        if len(bins) > MAX_BINS:
+            self._collapse()
+        self.zero_count += zero_count
+        self.count += count
+        self.sum += vsum
+        self.min = min(self.min, vmin)
+        self.max = max(self.max, vmax)
+        return self
+
+    @classmethod
+    def from_bytes(cls, data) -> "DDSketch":
+        _, accuracy, *_ = _HEADER.unpack_from(data)
+        return cls(accuracy).merge_bytes(data)
+
+
+def hour_bucket(timestamp: float) -> datetime:
+    """Returns the start of the UTC hour containing ``timestamp``."""
+    return datetime.fromtimestamp(timestamp - timestamp % 3600, tz=timezone.utc)
+
+
+class SketchAccumulator:
+    """Collects per-name CPU and memory sketches for hourly buckets.
+
+    The collector adds every sample here and periodically drains the pending
+    sketches into the ``process_sketches`` table, where they are merged with
+    whatever was already stored for the same bucket.
+    """
+
+    def __init__(self):
+        self.pending = {}
+
+    def add(self, timestamp: float, name: str, cpu_percent: float, memory_percent: float):
+        key = (hour_bucket(timestamp), name)
+        sketches = self.pending.get(key)
+        if sketches is None:
+            sketches = self.pending[key] = (DDSketch(), DDSketch())
+        sketches[0].add(cpu_percent)
+        sketches[1].add(memory_percent)
+
+    def add_batch(self, timestamp: float, batch):
+        """Adds one sweep's SampleBatch.
+
+        Processes whose name was denied are skipped, since sketches are keyed
+        by name; a denied CPU or memory percent is left out of its sketch.
+        """
+        names, cpu, memory = batch.names, batch.cpu, batch.memory
+        for i in range(len(batch)):
+            if names[i] is None:
+                continue
+            self.add(
+                timestamp, names[i],
+                None if cpu[i] == MISSING else cpu[i], None if memory[i] == MISSING else memory[i]
+            )
+
+    def drain(self):
+        pending = self.pending
+        self.pending = {}
+        return pending
+
+    def restore(self, pending):
+        """Puts drained sketches back, e.g. after a failed database write."""
+        for key, (cpu, memory) in pending.items():
+            current = self.pending.get(key)
+            if current is None:
+                self.pending[key] = (cpu, memory)
+            else:
+                current[0].merge(cpu)
+                current[1].merge(memory)
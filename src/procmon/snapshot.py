@@ -0,0 +1,213 @@
+import heapq
+import mmap
+import os
+import struct
+import tempfile
+import time
+
+import psutil
+
+from .metrics import METRIC_COLUMNS
+
+SNAPSHOT_FILE = os.getenv("PROCMON_SNAPSHOT_FILE", os.path.join(tempfile.gettempdir(), "procmon_snapshot.bin"))
+SNAPSHOT_CAPACITY = int(os.getenv("PROCMON_SNAPSHOT_CAPACITY", "65536"))
+# Snapshots older than this (six 5 s collection intervals) are from a collector
+# that has stopped or hung, and are not served as live data.
+SNAPSHOT_MAX_AGE = float(os.getenv("PROCMON_SNAPSHOT_MAX_AGE", "30"))
+
+MAGIC = b"PROCMON\x01"
+LAYOUT_VERSION = 2
+TOP_N = 64
+TOP_KEYS = ("cpu", "memory", "io")
+NAME_SIZE = 32
+
+# Layout: header | system totals | top-N index arrays | per-pid table.
+# The header's sequence number is a seqlock: odd while the collector is
+# writing, even once the snapshot is consistent.
+_HEADER = struct.Struct("<8sIIQdIIII")
+_SEQ = struct.Struct("<Q")
+_SEQ_OFFSET = 16
+_SYSTEM = struct.Struct("<ddQQQQ")
+_TOP = struct.Struct(f"<{TOP_N}I")
+_ENTRY = struct.Struct(f"<IffQIQQ{NAME_SIZE}s")
+
+_SYSTEM_OFFSET = _HEADER.size
+_TOP_OFFSET = _SYSTEM_OFFSET + _SYSTEM.size
+_TABLE_OFFSET = _TOP_OFFSET + _TOP.size * len(TOP_KEYS)
+
+SYSTEM_FIELDS = ("cpu_percent", "memory_percent", "memory_total", "memory_used", "disk_read_bytes", "disk_write_bytes")
+PROCESS_FIELDS = ("pid", "cpu_percent", "memory_percent", "rss", "num_threads", "read_bytes", "write_bytes", "name")
+
+_RSS, _THREADS, _READ, _WRITE = (METRIC_COLUMNS.index(field) for field in ("rss", "num_threads", "read_bytes", "write_bytes"))
+
+
+def snapshot_size(capacity: int) -> int:
+    return _TABLE_OFFSET + capacity * _ENTRY.size
+
+
+def _encode_name(name) -> bytes:
+    return (name or "").encode("utf-8", "replace")[:NAME_SIZE]
+
+
+def _decode_entry(data) -> dict:
+    entry = dict(zip(PROCESS_FIELDS, _ENTRY.unpack(data)))
+    entry["name"] = entry["name"].rstrip(b"\0").decode("utf-8", "replace")
+    return entry
+
+
+class SnapshotWriter:
+    """Publishes the collector's latest sweep into a memory-mapped file.
+
+    Processes are read straight from the sweep's SampleBatch columns;
+    metrics the active profile does not collect are stored as zero.
+    Processes beyond the file's capacity are dropped from the per-pid table
+    and the snapshot is flagged as truncated.
+    """
+
+    def __init__(self, path: str = SNAPSHOT_FILE, capacity: int = SNAPSHOT_CAPACITY):
+        self.path = path
+        self.capacity = capacity
+        # Build the file under a temporary name and rename it into place, so
+        # readers still mapping a previous collector's file keep a valid
+        # mapping instead of having it truncated underneath them (SIGBUS).
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), prefix=".procmon_snapshot.")
+        try:
+            os.fchmod(fd, 0o644)
+            os.ftruncate(fd, snapshot_size(capacity))
+            self._mm = mmap.mmap(fd, snapshot_size(capacity))
+            self._inode = os.fstat(fd).st_ino
+        except BaseException:
+            os.close(fd)
+            os.remove(temp_path)
+            raise
+        os.close(fd)
+        self._seq = 0
+        self._mm[:_HEADER.size] = _HEADER.pack(MAGIC, LAYOUT_VERSION, capacity, 0, 0.0, 0, TOP_N, 0, os.getpid())
+        os.replace(temp_path, path)
+
+    def publish(self, timestamp: float, system: tuple, batch):
+        count = min(len(batch), self.capacity)
+        pids, names, cpu, memory = batch.pids, batch.names, batch.cpu, batch.memory
+        rss, threads, read, write = (batch.metrics[i] for i in (_RSS, _THREADS, _READ, _WRITE))
+        sort_keys = {
+            "cpu": cpu.__getitem__,
+            "memory": memory.__getitem__,
+            "io": lambda i: max(read[i], 0) + max(write[i], 0),
+        }
+        tops = []
+        for key in TOP_KEYS:
+            indices = heapq.nlargest(TOP_N, range(count), key=sort_keys[key])
+            # Unused slots point past the end of the table.
+            tops.append(indices + [self.capacity] * (TOP_N - len(indices)))
+
+        mm = self._mm
+        self._seq += 1
+        _SEQ.pack_into(mm, _SEQ_OFFSET, self._seq)
+        mm[:_HEADER.size] = _HEADER.pack(
+            MAGIC, LAYOUT_VERSION, self.capacity, self._seq, timestamp, count, TOP_N,
+            int(len(batch) > self.capacity), os.getpid()
+        )
+        _SYSTEM.pack_into(mm, _SYSTEM_OFFSET, *system)
+        for i, indices in enumerate(tops):
+            _TOP.pack_into(mm, _TOP_OFFSET + i * _TOP.size, *indices)
+        offset = _TABLE_OFFSET
+        for i in range(count):
+            _ENTRY.pack_into(
+                mm, offset, pids[i], max(cpu[i], 0.0), max(memory[i], 0.0), max(rss[i], 0), max(threads[i], 0),
+                max(read[i], 0), max(write[i], 0), _encode_name(names[i])
+            )
+            offset += _ENTRY.size
+        self._seq += 1
+        _SEQ.pack_into(mm, _SEQ_OFFSET, self._seq)
+
+    def close(self):
+        self._mm.close()
+        try:
+            # Leave the file alone if another collector has replaced it since.
+            if os.stat(self.path).st_ino == self._inode:
+                os.remove(self.path)
+        except OSError:
+            pass
+
+
+def read_snapshot(path: str = SNAPSHOT_FILE, include_processes: bool = False, retries: int = 1000, max_age: float | None = SNAPSHOT_MAX_AGE):
+    """Reads a consistent copy of the latest snapshot without touching /proc.
+
+    By default only system totals and the top-N processes per key are
+    decoded; ``include_processes`` also returns the full per-pid table.
+    Returns None if no collector has published a snapshot, or, unless
+    ``max_age`` is None, if the collector that wrote it has exited or its
+    last sweep is more than ``max_age`` seconds old.
+    """
+    try:
+        with open(path, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+
+    try:
+        if len(mm) < _TABLE_OFFSET or mm[:len(MAGIC)] != MAGIC:
+            return None
+        for _ in range(retries):
+            seq = _SEQ.unpack_from(mm, _SEQ_OFFSET)[0]
+            if seq == 0:
+                return None
+            if seq % 2:
+                time.sleep(0.0005)
+                continue
+
+            header = _HEADER.unpack_from(mm)
+            _, version, capacity, _, timestamp, count, top_n, truncated, collector_pid = header
+            if version != LAYOUT_VERSION or len(mm) < snapshot_size(capacity):
+                return None
+            if max_age is not None and (time.time() - timestamp > max_age or not psutil.pid_exists(collector_pid)):
+                return None
+            system = _SYSTEM.unpack_from(mm, _SYSTEM_OFFSET)
+            tops = [_TOP.unpack_from(mm, _TOP_OFFSET + i * _TOP.size) for i in range(len(TOP_KEYS))]
+            entries = {}
+            for indices in tops:
+                for index in indices:
+                    if index < count and index not in entries:
+                        offset = _TABLE_OFFSET + index * _ENTRY.size
+                        entries[index] = mm[offset:offset + _ENTRY.size]
+            table = mm[_TABLE_OFFSET:_TABLE_OFFSET + count * _ENTRY.size] if include_processes else None
+
+            if _SEQ.unpack_from(mm, _SEQ_OFFSET)[0] != seq:
+                continue
+
+            snapshot = {
+                "timestamp": timestamp,
+                "collector_pid": collector_pid,
+                "truncated": bool(truncated),
+                "process_count": count,
+                "system": dict(zip(SYSTEM_FIELDS, system)),
+                "top": {
+                    key: [_decode_entry(entries[index]) for index in indices if index < count]
+                    for key, indices in zip(TOP_KEYS, tops)
+                },
+            }
+            if include_processes:
+                snapshot["processes"] = [_decode_entry(table[i:i + _ENTRY.size]) for i in range(0, len(table), _ENTRY.size)]
+            return snapshot
+        return None
+    finally:
+        mm.close()
+
+
+_RANK_KEYS = {
+    "cpu": lambda entry: entry["cpu_percent"],
+    "memory": lambda entry: entry["memory_percent"],
+    "io": lambda entry: entry["read_bytes"] + entry["write_bytes"],
+}
+
+
+def top_processes(snapshot: dict, key: str, limit: int):
+    """Returns the ``limit`` heaviest processes by ``key``.
+
+    Up to TOP_N come from the precomputed index; larger limits are ranked
+    from the full per-pid table, which must have been read with
+    ``include_processes``.
+    """
+    if limit <= TOP_N or "processes" not in snapshot:
+        return snapshot["top"][key][:limit]
+    return sorted(snapshot["processes"], key=_RANK_KEYS[key], reverse=True)[:limit]
@@ -0,0 +1,45 @@
+import pytest
+
+from benchmarks.soak_collector import run_soak
+from src.procmon.batch import DEFAULT_CAPACITY, SampleBatch
+from src.procmon.metrics import METRIC_COLUMNS
+
+def test_batch_grows_and_is_reused():
+    batch = SampleBatch(capacity=2)
+    for pid in range(5):
+        batch.append(pid, "python", 1.5, 0.5, *([pid] * len(METRIC_COLUMNS)))
+    assert len(batch) == 5
+    assert batch.capacity == 8
+
+    batch.clear()
+    batch.append(42, None, None, None, *([None] * len(METRIC_COLUMNS)))
+    assert len(batch) == 1
+    assert batch.capacity == 8
+    assert batch.row(0) == (42, None, None, None, *([None] * len(METRIC_COLUMNS)))
+
+def test_batch_interns_names_and_selects_columns():
+    batch = SampleBatch()
+    batch.append(1, "".join(["post", "gres"]), 1.0, 2.0, 100, None, 3, *([None] * (len(METRIC_COLUMNS) - 3)))
+    batch.append(2, "".join(["postg", "res"]), 1.0, 2.0, 200, None, 4, *([None] * (len(METRIC_COLUMNS) - 3)))
+    assert batch.names[0] is batch.names[1]
+    assert list(batch.rows(("rss", "uss", "num_threads"))) == [
+        (1, "postgres", 1.0, 2.0, 100, None, 3),
+        (2, "postgres", 1.0, 2.0, 200, None, 4),
+    ]
+
+def test_batch_requires_every_metric_column():
+    batch = SampleBatch()
+    batch.append(1, "init", 1.0, 2.0, *range(len(METRIC_COLUMNS)))
+    batch.clear()
+    with pytest.raises(ValueError):
+        batch.append(2, "bash", 1.0, 2.0, 100)
+    with pytest.raises(ValueError):
+        batch.append(2, "bash", 1.0, 2.0, *range(len(METRIC_COLUMNS) + 1))
+    assert len(batch) == 0
+
+def test_caches_stay_bounded_under_pid_churn():
+    # RSS growth is left to the soak benchmark, which runs long enough to measure it.
+    history = run_soak(hours=0.5, processes=200, churn=0.5)
+    assert history[-1]["spawned"] > 200 * 150
+    assert all(entry["cached_processes"] == 200 for entry in history)
+    assert all(entry["batch_capacity"] == DEFAULT_CAPACITY for entry in history)
@@ -1,3 +1,9 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.procmon.maintenance import collect_db_stats, rollup_sketches
+from src.procmon.sketch import DDSketch
 
 
 def test_db_connection(db_connection):
@@ -6,4 +12,39 @@ def test_db_connection(db_connection):
 def test_setup_database(db_connection):
     cur = db_connection.cursor()
     cur.execute("SELECT 1 FROM information_schema.tables WHERE table_name = 'processes';")
-    assert cur.fetchone() is not None
\ No newline at end of file
+    assert cur.fetchone() is not None
+
+
+def test_collect_db_stats(db_connection):
+    cur = db_connection.cursor()
+    before = {entry["table"]: entry for entry in collect_db_stats(cur)["tables"]}
+    cur.execute("INSERT INTO gpu_process_usage (time, gpu_index, pid, name, samples) SELECT now(), 0, g, 'stats-test', 1 FROM generate_series(1, 50) g")
+    after = {entry["table"]: entry for entry in collect_db_stats(cur)["tables"]}
+    db_connection.rollback()
+
+    assert {"processes", "gpu_usage", "gpu_process_usage", "process_sketches", "process_lifecycle"} <= set(after)
+    assert after["processes"]["total_bytes"] > 0
+    # gpu_process_usage has a time index, so the new rows show up in the ingest rate.
+    assert after["gpu_process_usage"]["rows_per_second"] == pytest.approx(before["gpu_process_usage"]["rows_per_second"] + 50 / 600)
+
+
+def test_rollup_sketches(db_connection):
+    cur = db_connection.cursor()
+    day = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    # The last hour of the previous day and the first of the next stay out of the rollup.
+    for hour in (-1, 0, 5, 23, 24):
+        cpu, memory = DDSketch(), DDSketch()
+        cpu.add(hour + 2.0)
+        memory.add(1.0)
+        cur.execute(
+            "INSERT INTO process_sketches (bucket, name, cpu_sketch, memory_sketch) VALUES (%s, %s, %s, %s)",
+            (day + timedelta(hours=hour), "rollup-test", cpu.to_bytes(), memory.to_bytes())
+        )
+    assert rollup_sketches(cur, day) == 1
+    cur.execute("SELECT cpu_sketch, memory_sketch FROM process_sketches_daily WHERE bucket = %s AND name = 'rollup-test'", (day,))
+    cpu_sketch, memory_sketch = cur.fetchone()
+    db_connection.rollback()
+
+    cpu = DDSketch.from_bytes(cpu_sketch)
+    assert (cpu.count, cpu.min, cpu.max) == (3, 2.0, 25.0)
+    assert DDSketch.from_bytes(memory_sketch).count == 3
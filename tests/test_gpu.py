@@ -0,0 +1,116 @@
+import json
+
+import pytest
+
+from src.procmon import gpu
+from src.procmon.batch import SampleBatch
+from src.procmon.gpu import FakeNvml, GpuProcessSampler, NVMLError, join_process_names
+from src.procmon.metrics import METRIC_COLUMNS
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+def make_nvml(clock):
+    # A 1s burst from pid 100 then 3s where only pid 200 holds memory, repeating.
+    return FakeNvml([{
+        "name": "Fake A100",
+        "timeline": [
+            {"duration": 1, "processes": {"100": {"memory": 2048, "sm": 90, "mem": 30}}},
+            {"duration": 3, "processes": {"200": {"memory": 4096, "sm": 0, "mem": 0, "graphics": True}}},
+        ],
+    }], sample_period=0.25, buffer_size=8, clock=clock)
+
+def test_fake_nvml_follows_script():
+    clock = Clock()
+    nvml = make_nvml(clock)
+    with pytest.raises(NVMLError):
+        nvml.nvmlDeviceGetCount()
+    nvml.nvmlInit()
+    handle = nvml.nvmlDeviceGetHandleByIndex(0)
+    assert nvml.nvmlDeviceGetName(handle) == "Fake A100"
+    assert nvml.nvmlDeviceGetUtilizationRates(handle).gpu == 90
+    assert [p.pid for p in nvml.nvmlDeviceGetComputeRunningProcesses(handle)] == [100]
+
+    clock.now += 1.5
+    assert nvml.nvmlDeviceGetComputeRunningProcesses(handle) == []
+    assert [(p.pid, p.usedGpuMemory) for p in nvml.nvmlDeviceGetGraphicsRunningProcesses(handle)] == [(200, 4096)]
+    samples = nvml.nvmlDeviceGetProcessUtilization(handle, 0)
+    # Samples at 0, 0.25 ... 1.5s; the first four fall in pid 100's burst.
+    assert [s.smUtil for s in samples if s.pid == 100] == [90] * 4
+    with pytest.raises(NVMLError):
+        nvml.nvmlDeviceGetProcessUtilization(handle, samples[-1].timeStamp)
+    nvml.nvmlShutdown()
+
+def test_sampler_catches_bursts_between_sweeps():
+    clock = Clock()
+    nvml = make_nvml(clock)
+    sampler = GpuProcessSampler(nvml)
+    sampler.poll()
+    clock.now += 1.0
+    sampler.poll()
+    clock.now += 1.0
+    sampler.poll()
+    records = sampler.drain()
+    # The sample taken as the sampler was created predates it.
+    gpu_index, pid, samples, avg_sm, max_sm, avg_mem, max_mem, used_memory = records[0]
+    assert (gpu_index, pid, samples, avg_sm, max_sm, max_mem, used_memory) == (0, 100, 3, 90, 90, 30, 2048)
+    assert records[1][:3] == (0, 200, 5)
+    assert records[1][-1] == 4096
+
+    # Samples already counted are not counted again.
+    sampler.poll()
+    assert sampler.drain() == [(0, 200, 0, None, None, None, None, 4096)]
+
+    # Only the last 8 samples survive in the driver's buffer, but the whole
+    # burst is among them.
+    clock.now += 2.75
+    sampler.poll()
+    assert [record[:3] for record in sampler.drain()] == [(0, 100, 4), (0, 200, 4)]
+
+def test_sampler_skips_samples_from_before_it_started():
+    clock = Clock()
+    nvml = make_nvml(clock)
+    # pid 100's burst is still in the driver's buffer when the sampler starts.
+    clock.now += 1.5
+    sampler = GpuProcessSampler(nvml)
+    sampler.poll()
+    assert sampler.drain() == [(0, 200, 0, None, None, None, None, 4096)]
+    clock.now += 0.5
+    sampler.poll()
+    assert [record[:3] for record in sampler.drain()] == [(0, 200, 2)]
+
+def test_load_nvml_reports_bad_fake_script(tmp_path, monkeypatch):
+    script = tmp_path / "gpus.json"
+    script.write_text("{not json")
+    monkeypatch.setattr(gpu, "FAKE_NVML", str(script))
+    with pytest.raises(ValueError, match="PROCMON_FAKE_NVML"):
+        gpu.load_nvml()
+    monkeypatch.setattr(gpu, "FAKE_NVML", str(tmp_path / "missing.json"))
+    with pytest.raises(ValueError, match="missing.json"):
+        gpu.load_nvml()
+
+def test_sampler_requires_devices():
+    assert GpuProcessSampler.is_supported(make_nvml(Clock()))
+    assert not GpuProcessSampler.is_supported(FakeNvml([]))
+
+def test_join_process_names():
+    batch = SampleBatch()
+    batch.append(100, "python", 1.0, 1.0, *([None] * len(METRIC_COLUMNS)))
+    batch.append(300, "bash", 1.0, 1.0, *([None] * len(METRIC_COLUMNS)))
+    records = [(0, 100, 4, 90.0, 90, 30.0, 30, 2048), (0, 200, 0, None, None, None, None, 4096)]
+    assert join_process_names(records, batch) == [
+        (0, 100, "python", 4, 90.0, 90, 30.0, 30, 2048),
+        (0, 200, None, 0, None, None, None, None, 4096),
+    ]
+
+def test_fake_nvml_from_file(tmp_path):
+    script = tmp_path / "gpus.json"
+    script.write_text(json.dumps({"sample_period": 0.5, "devices": [{"name": "GPU 0"}, {"name": "GPU 1"}]}))
+    nvml = FakeNvml.from_file(str(script))
+    nvml.nvmlInit()
+    assert nvml.nvmlDeviceGetCount() == 2
+    assert nvml.sample_period == 0.5
@@ -0,0 +1,153 @@
+import json
+from datetime import datetime, timezone
+
+import pytest
+from rich.console import Console
+
+from src.procmon.batch import SampleBatch
+from src.procmon.history import compare_windows, parse_window, query_comparison, query_percentiles
+from src.procmon.metrics import METRIC_COLUMNS
+from src.procmon.sketch import DDSketch, SketchAccumulator
+
+def sketches(cpu_values, memory_value=5.0):
+    cpu, memory = DDSketch(), DDSketch()
+    for value in cpu_values:
+        cpu.add(value)
+        memory.add(memory_value)
+    return cpu, memory
+
+def test_parse_window():
+    assert parse_window("2024-01-01 .. 2024-01-08") == ("2024-01-01", "2024-01-08")
+    for bad in ("2024-01-01", "..2024-01-08", "2024-01-01.."):
+        with pytest.raises(ValueError):
+            parse_window(bad)
+
+def test_compare_windows_ranks_significant_changes():
+    merged = {
+        (0, "api"): sketches([10.0] * 100), (1, "api"): sketches([20.0] * 100),
+        (0, "db"): sketches([40.0] * 100), (1, "db"): sketches([30.0] * 100),
+        (0, "cron"): sketches([10.0] * 100), (1, "cron"): sketches([10.5] * 100),
+        # Below the baseline floor: 0.1% -> 0.15% is +5 points of 1%, not +50%.
+        (0, "idle"): sketches([0.1] * 100), (1, "idle"): sketches([0.15] * 100),
+        (1, "worker"): sketches([50.0] * 100),
+        (0, "legacy"): sketches([5.0] * 100),
+        # Too few samples in A to compare, so it is reported as new.
+        (0, "blip"): sketches([1.0] * 3), (1, "blip"): sketches([9.0] * 100),
+    }
+    rows = compare_windows(merged, rank_by="cpu_p95", min_change=10)
+    assert [(row["name"], row["status"]) for row in rows] == [
+        ("api", "changed"), ("db", "changed"), ("worker", "new"), ("blip", "new"), ("legacy", "gone")
+    ]
+    assert rows[0]["change_percent"] == pytest.approx(100, rel=0.05)
+    assert rows[0]["cpu_avg_a"] == pytest.approx(10)
+    assert rows[0]["samples_b"] == 100
+    assert rows[2]["cpu_max_a"] is None
+
+    assert [row["name"] for row in compare_windows(merged, rank_by="memory_avg", min_change=10)] == ["blip", "worker", "legacy"]
+
+class FakeCursor:
+    def __init__(self, bounds, rows):
+        self.bounds = bounds
+        self.rows = rows
+        self.executed = []
+
+    def execute(self, query, params):
+        self.executed.append((query, params))
+
+    def fetchall(self):
+        return self.bounds
+
+    def fetchmany(self, size):
+        page, self.rows = self.rows[:size], self.rows[size:]
+        return page
+
+def stored(window, name, hours):
+    # One row per (window, name) holding that window's daily and hourly sketches, as array_agg returns them.
+    parts = [sketches(values) for values in hours]
+    return (window, name, [memoryview(cpu.to_bytes()) for cpu, _ in parts], [memoryview(mem.to_bytes()) for _, mem in parts])
+
+def utc(day, hour=0):
+    return datetime(2024, 1, day, hour, tzinfo=timezone.utc)
+
+def run_comparison(output_format):
+    # Window A has rollups for its first two days and the 4th; window B has none yet.
+    bounds = [
+        (0, utc(1), utc(5, 12), [utc(1), utc(2), utc(4)]),
+        (1, utc(8), utc(9), []),
+    ]
+    cur = FakeCursor(bounds, [
+        stored(0, "api", [[10.0] * 50, [12.0] * 50]),
+        stored(1, "api", [[20.0] * 50, [30.0] * 50]),
+    ])
+    console = Console(width=250, record=True)
+    windows = [("2024-01-01", "2024-01-08"), ("2024-01-08", "2024-01-15")]
+    query_comparison(console, cur, windows, "ap", output_format, "cpu_max", 10)
+    return cur, console.export_text()
+
+def test_query_comparison_outputs():
+    cur, output = run_comparison("json")
+    (_, bounds_params), (query, params) = cur.executed
+    assert bounds_params == ["2024-01-01", "2024-01-08", "2024-01-08", "2024-01-15"]
+    assert query.count("FROM process_sketches_daily d") == 1
+    assert query.count("FROM process_sketches s") == 1
+    assert query.endswith("GROUP BY label, name")
+    # Rolled-up days are read as daily sketches; only the gaps between them are read hourly.
+    assert params == [
+        [0, 0, 0], [utc(1), utc(2), utc(4)],
+        [0, 0, 1], [utc(3), utc(5), utc(8)], [utc(4), utc(5, 12), utc(9)],
+        "%ap%",
+    ]
+    (row,) = json.loads(output)
+    assert (row["samples_a"], row["samples_b"]) == (100, 100)
+    assert row["change_percent"] == pytest.approx(150, rel=0.02)
+
+    _, output = run_comparison("csv")
+    header, line = output.strip().splitlines()
+    assert header.startswith("name,samples_a,samples_b,cpu_avg_a,cpu_avg_b")
+    assert line.startswith("api,100,100,")
+
+    _, output = run_comparison("table")
+    assert "api" in output and "+1" in output
+
+def test_compare_windows_ranks_by_a_metric_that_was_denied():
+    cpu, memory = sketches([10.0] * 100)
+    denied = (cpu, DDSketch())
+    merged = {(0, "api"): denied, (1, "api"): sketches([20.0] * 100, memory_value=8.0)}
+    (row,) = compare_windows(merged, rank_by="memory_p95", min_change=10)
+    assert (row["status"], row["samples_a"], row["memory_p95_b"]) == ("new", 0, pytest.approx(8.0, rel=0.02))
+    assert compare_windows({(0, "api"): denied}, rank_by="memory_max") == []
+
+def run_percentiles(output_format):
+    # As the collector records a sweep where one process denied its CPU times.
+    batch = SampleBatch()
+    batch.append(1, "secret", None, 2.0, *([None] * len(METRIC_COLUMNS)))
+    batch.append(2, "api", 30.0, 4.0, *([None] * len(METRIC_COLUMNS)))
+    accumulator = SketchAccumulator()
+    accumulator.add_batch(0.0, batch)
+    cur = FakeCursor([], [
+        (None, name, memoryview(cpu.to_bytes()), memoryview(memory.to_bytes()))
+        for (_, name), (cpu, memory) in accumulator.drain().items()
+    ])
+    console = Console(width=250, record=True)
+    query_percentiles(console, cur, [50.0, 95.0], None, None, None, None, output_format)
+    return console.export_text()
+
+def test_percentiles_with_denied_cpu():
+    rows = json.loads(run_percentiles("json"))
+    assert [(row["name"], row["samples"], row["cpu_p95"]) for row in rows] == [("api", 1, pytest.approx(30.0, rel=0.02)), ("secret", 1, None)]
+    assert rows[1]["memory_p95"] == pytest.approx(2.0, rel=0.02)
+
+    assert "secret,1,,," in run_percentiles("csv")
+    assert "N/A" in run_percentiles("table")
+
+@pytest.mark.parametrize("aggregate,days", [(None, [utc(2)]), ("daily", [utc(2)]), ("hourly", [])])
+def test_percentiles_read_daily_rollups(aggregate, days):
+    cpu, memory = sketches([10.0] * 10)
+    cur = FakeCursor([(0, utc(1, 6), utc(3, 12), [utc(2)])], [(None, "api", memoryview(cpu.to_bytes()), memoryview(memory.to_bytes()))])
+    query_percentiles(Console(record=True), cur, [95.0], "ap", "2024-01-01 06:00", "2024-01-03 12:00", aggregate, "json")
+    (_, bounds_params), (query, params) = cur.executed
+    assert bounds_params == ["2024-01-01 06:00", "2024-01-03 12:00"]
+    assert "date_trunc('hour'" not in query
+    # Hourly buckets are read from the start time itself up to the first rolled-up day, and after the last one.
+    ranges = [[0, 0], [utc(1, 6), utc(3)], [utc(2), utc(3, 12)]] if days else [[0], [utc(1, 6)], [utc(3, 12)]]
+    assert params[-6:] == [[0] * len(days), days, *ranges, "%ap%"]
@@ -0,0 +1,83 @@
+import pytest
+from click.testing import CliRunner
+
+from src.procmon import cli
+from src.procmon.lifecycle import ProcessChurnDetector, parse_stat
+
+def stat_line(pid, name, cpu_ticks=0, start_ticks=1000, rss_pages=100):
+    fields = ["S", "1"] + ["0"] * 9 + [str(cpu_ticks), "0"] + ["0"] * 6 + [str(start_ticks), "0", str(rss_pages)] + ["0"] * 20
+    return f"{pid} ({name}) {' '.join(fields)}\n".encode()
+
+def write_proc(root, pid, name, **kwargs):
+    (root / str(pid)).mkdir(exist_ok=True)
+    (root / str(pid) / "stat").write_bytes(stat_line(pid, name, **kwargs))
+
+def remove_proc(root, pid):
+    (root / str(pid) / "stat").unlink()
+    (root / str(pid)).rmdir()
+
+@pytest.fixture
+def detector(tmp_path):
+    detector = ProcessChurnDetector(proc_root=str(tmp_path), interval=0.1, window=10)
+    detector.clock_ticks = 100
+    detector.page_size = 4096
+    detector.boot_time = 1000.0
+    return detector
+
+def test_parse_stat_with_awkward_name():
+    name, start_ticks, cpu_ticks, rss_pages = parse_stat(stat_line(42, "cc1 (plus) x", cpu_ticks=250, start_ticks=5000, rss_pages=7))
+    assert name == "cc1 (plus) x"
+    assert (start_ticks, cpu_ticks, rss_pages) == (5000, 250, 7)
+
+def test_records_short_lived_process(tmp_path, detector):
+    write_proc(tmp_path, 1, "init")
+    (tmp_path / "self").mkdir()
+    detector.poll(now=2000.0)
+
+    write_proc(tmp_path, 500, "gcc", cpu_ticks=10, rss_pages=100)
+    detector.poll(now=2000.1)
+    write_proc(tmp_path, 500, "gcc", cpu_ticks=80, rss_pages=300)
+    detector.poll(now=2000.2)
+    remove_proc(tmp_path, 500)
+    detector.poll(now=2000.3)
+
+    records = detector.drain()
+    assert len(records) == 1
+    pid, name, start_time, exit_time, cpu_time, max_rss = records[0]
+    assert (pid, name) == (500, "gcc")
+    assert start_time.timestamp() == pytest.approx(1010.0)
+    assert exit_time.timestamp() == pytest.approx(2000.3)
+    assert cpu_time == pytest.approx(0.8)
+    assert max_rss == 300 * 4096
+    assert detector.drain() == []
+
+def test_ignores_baseline_and_long_lived_processes(tmp_path, detector):
+    write_proc(tmp_path, 1, "init")
+    detector.poll(now=0.0)
+    write_proc(tmp_path, 600, "server")
+    detector.poll(now=1.0)
+    detector.poll(now=20.0)
+    remove_proc(tmp_path, 1)
+    remove_proc(tmp_path, 600)
+    detector.poll(now=21.0)
+    assert detector.drain() == []
+
+def test_detects_pid_reuse(tmp_path, detector):
+    detector.poll(now=0.0)
+    write_proc(tmp_path, 700, "make", start_ticks=100)
+    detector.poll(now=1.0)
+    write_proc(tmp_path, 700, "ld", start_ticks=200)
+    detector.poll(now=2.0)
+    remove_proc(tmp_path, 700)
+    detector.poll(now=3.0)
+    assert [record[1] for record in detector.drain()] == ["make", "ld"]
+
+def test_backs_off_when_polls_are_slow(detector):
+    detector.max_load = 0.1
+    assert detector.next_interval(0.001) == 0.1
+    assert detector.next_interval(0.07) == pytest.approx(0.63)
+
+def test_history_rejects_lifecycle_with_incompatible_options():
+    result = CliRunner().invoke(cli.main, ["history", "--lifecycle", "--aggregate", "daily", "--gpu"])
+    assert result.exit_code == 2
+    assert "--lifecycle cannot be combined with --aggregate, --gpu" in result.output
@@ -0,0 +1,56 @@
+import contextlib
+import os
+import types
+
+import psutil
+import pytest
+
+from src.procmon.metrics import METRIC_COLUMNS, PROFILES, ROW_FIELDS, get_profile_metrics, sample_process
+
+@pytest.mark.parametrize("profile", PROFILES)
+def test_sample_process_collects_profile_metrics(profile):
+    metrics = get_profile_metrics(profile)
+    row = dict(zip(ROW_FIELDS, sample_process(psutil.Process(os.getpid()), metrics)))
+
+    assert row["pid"] == os.getpid()
+    assert row["name"]
+    assert row["memory_percent"] > 0
+    for column in METRIC_COLUMNS:
+        if column not in metrics:
+            assert row[column] is None, column
+    if "rss" in metrics:
+        assert row["rss"] > 0
+    if "num_threads" in metrics:
+        assert row["num_threads"] >= 1
+
+def test_profiles_only_grow():
+    assert set(PROFILES["minimal"]) <= set(PROFILES["standard"]) <= set(PROFILES["full"])
+    assert set(PROFILES["full"]) == set(METRIC_COLUMNS)
+
+def test_unknown_profile():
+    with pytest.raises(ValueError):
+        get_profile_metrics("everything")
+
+class DeniedProcess:
+    """Lets only io_counters through, like another user's process on some platforms."""
+
+    pid = 4242
+
+    def oneshot(self):
+        return contextlib.nullcontext()
+
+    def io_counters(self):
+        return types.SimpleNamespace(read_bytes=3, write_bytes=4)
+
+    def __getattr__(self, name):
+        def denied(*args):
+            raise psutil.AccessDenied(self.pid)
+        return denied
+
+def test_denied_attributes_are_none():
+    row = dict(zip(ROW_FIELDS, sample_process(DeniedProcess(), PROFILES["full"])))
+
+    assert row["pid"] == 4242
+    for column in ("name", "cpu_percent", "memory_percent", "rss", "uss", "num_threads", "num_fds", "ctx_switches_voluntary", "ctx_switches_involuntary"):
+        assert row[column] is None, column
+    assert (row["read_bytes"], row["write_bytes"]) == (3, 4)
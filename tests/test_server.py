@@ -0,0 +1,180 @@
+import asyncio
+import http.client
+import json
+import threading
+import time
+
+import pytest
+
+from src.procmon.batch import SampleBatch
+from src.procmon.server import QueryServer, HttpError, parse_history_params
+from src.procmon.snapshot import SnapshotWriter
+
+SYSTEM = (12.5, 40.0, 16 * 1024**3, 6 * 1024**3, 1000, 2000)
+
+
+class FakeCursor:
+    def __init__(self, pool):
+        self.pool = pool
+        self.rows = []
+        self.description = [("time",), ("pid",), ("name",)]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, query, params):
+        self.pool.queries.append((query, params))
+        self.pool.release.wait(5)
+        if self.pool.error:
+            raise self.pool.error
+        self.rows = list(self.pool.rows)
+
+    def fetchmany(self, size):
+        page, self.rows = self.rows[:size], self.rows[size:]
+        return page
+
+
+class FakeConnection:
+    closed = 0
+
+    def __init__(self, pool):
+        self.pool = pool
+
+    def cursor(self, name=None):
+        return FakeCursor(self.pool)
+
+    def rollback(self):
+        pass
+
+
+class FakePool:
+    """Stands in for ThreadedConnectionPool; ``release`` gates every query."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.error = None
+        self.queries = []
+        self.release = threading.Event()
+        self.release.set()
+        self.checked_out = 0
+
+    def getconn(self):
+        self.checked_out += 1
+        return FakeConnection(self)
+
+    def putconn(self, conn, close=False):
+        self.checked_out -= 1
+
+    def closeall(self):
+        pass
+
+
+@pytest.fixture
+def server(tmp_path):
+    """Runs a QueryServer on an ephemeral port in a background loop."""
+    pool = FakePool([("2024-01-01 00:00:00+00", pid, f"proc-{pid}") for pid in range(2500)])
+    query_server = QueryServer(pool_size=4, snapshot_path=str(tmp_path / "snapshot.bin"), pool=pool)
+    loop = asyncio.new_event_loop()
+    listener = loop.run_until_complete(query_server.start("127.0.0.1", 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    query_server.port = listener.sockets[0].getsockname()[1]
+    query_server.fake_pool = pool
+    yield query_server
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    listener.close()
+    loop.run_until_complete(listener.wait_closed())
+    loop.close()
+    query_server.close()
+
+def get(server, path, conn=None):
+    conn = conn or http.client.HTTPConnection("127.0.0.1", server.port, timeout=5)
+    conn.request("GET", path)
+    response = conn.getresponse()
+    return response.status, response.getheader("Transfer-Encoding"), json.loads(response.read())
+
+def test_parse_history_params():
+    assert parse_history_params("pid=42&name=python&limit=10") == (
+        "python", 42, None, None, None, False, None, False, False, 10
+    )
+    assert parse_history_params("limit=10&pid=42&name=python") == parse_history_params("pid=42&name=python&limit=10")
+    assert parse_history_params("gpu=1&gpu_index=0")[5:7] == (True, 0)
+    assert parse_history_params("gpu_processes=1&gpu_index=1&pid=5")[:9] == (
+        None, 5, None, None, None, False, 1, False, True
+    )
+    for bad in ("pid=abc", "aggregate=yearly", "gpu=1&lifecycle=1", "gpu=1&gpu_processes=1", "limit=0", "colour=red", "pid=1&pid=2"):
+        with pytest.raises(HttpError):
+            parse_history_params(bad)
+
+def test_history_streams_all_rows(server):
+    conn = http.client.HTTPConnection("127.0.0.1", server.port, timeout=5)
+    status, encoding, rows = get(server, "/history?name=proc&limit=5000", conn)
+    assert status == 200
+    assert encoding == "chunked"
+    assert len(rows) == 2500
+    assert rows[1] == {"time": "2024-01-01 00:00:00+00", "pid": 1, "name": "proc-1"}
+    query, params = server.fake_pool.queries[-1]
+    assert "name ILIKE %s" in query
+    assert params == ["%proc%", 5000]
+
+    # The same keep-alive connection serves the next request.
+    server.fake_pool.rows = []
+    assert get(server, "/history?pid=7", conn)[::2] == (200, [])
+    assert server.fake_pool.checked_out == 0
+
+def test_identical_requests_are_coalesced(server):
+    pool = server.fake_pool
+    pool.release.clear()
+    results = []
+
+    def request():
+        results.append(get(server, "/history?pid=3"))
+
+    clients = [threading.Thread(target=request) for _ in range(8)]
+    for client in clients:
+        client.start()
+    for _ in range(500):
+        in_flight = list(server.in_flight.values())
+        if in_flight and in_flight[0].subscribers == 8:
+            break
+        threading.Event().wait(0.01)
+    pool.release.set()
+    for client in clients:
+        client.join()
+
+    assert len(pool.queries) == 1
+    assert len(results) == 8
+    assert all(status == 200 and len(rows) == 2500 for status, _, rows in results)
+    assert server.in_flight == {}
+
+def test_errors(server):
+    assert get(server, "/history?aggregate=yearly")[0] == 400
+    assert get(server, "/nope")[0] == 404
+    assert get(server, "/snapshot")[0] == 503
+
+    from psycopg2 import OperationalError
+    server.fake_pool.error = OperationalError("server closed the connection")
+    status, _, body = get(server, "/history")
+    assert status == 503
+    assert "server closed the connection" in body["error"]
+    assert server.fake_pool.checked_out == 0
+
+def test_snapshot_and_health(server):
+    writer = SnapshotWriter(server.snapshot_path, capacity=10)
+    batch = SampleBatch()
+    batch.append(1, "init", 1.0, 0.5, 4096, None, 1, None, None, None, 10, 5)
+    now = time.time()
+    writer.publish(now, SYSTEM, batch)
+    try:
+        status, _, snapshot = get(server, "/snapshot?processes=1")
+        assert status == 200
+        assert snapshot["timestamp"] == now
+        assert snapshot["processes"][0]["name"] == "init"
+        assert "processes" not in get(server, "/snapshot")[2]
+    finally:
+        writer.close()
+    assert get(server, "/health")[2] == {"status": "ok", "in_flight": 0}
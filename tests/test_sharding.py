@@ -0,0 +1,89 @@
+import os
+
+from src.procmon.batch import SampleBatch
+from src.procmon.metrics import METRIC_COLUMNS, PROFILES
+from src.procmon.sharding import ShardedSampler, INITIAL_SHARD_CAPACITY
+
+
+class FakeShardSource:
+    """Serves a scripted sequence of pid tables, one per sweep."""
+
+    sweeps = [
+        range(1, 101),
+        range(50, 151),
+        range(1, INITIAL_SHARD_CAPACITY * 3),
+    ]
+
+    def __init__(self, metrics, shard, shard_count):
+        self.shard = shard
+        self.shard_count = shard_count
+        self.metrics = metrics
+        self.sweep = 0
+
+    def sample(self, batch):
+        pids = self.sweeps[self.sweep]
+        self.sweep += 1
+        for pid in pids:
+            if pid % self.shard_count == self.shard:
+                batch.append(
+                    pid, f"name-{pid}-{self.sweep}" if pid % 10 == 0 else f"name-{pid}", float(pid), pid / 10,
+                    *(pid * 2 if column in self.metrics else None for column in METRIC_COLUMNS)
+                )
+        return batch
+
+
+def test_sharded_sampler_merges_all_shards():
+    sampler = ShardedSampler(3, PROFILES["standard"], source_factory=FakeShardSource)
+    try:
+        for sweep, pids in enumerate(FakeShardSource.sweeps, start=1):
+            batch = sampler.sample(SampleBatch())
+            rows = sorted(batch.row(i) for i in range(len(batch)))
+            assert [row[0] for row in rows] == list(pids)
+            pid, name, cpu_percent, memory_percent, *values = rows[-1]
+            assert cpu_percent == float(pid)
+            assert values == [pid * 2 if column in PROFILES["standard"] else None for column in METRIC_COLUMNS]
+            assert name == (f"name-{pid}-{sweep}" if pid % 10 == 0 else f"name-{pid}")
+    finally:
+        sampler.close()
+
+
+class CrashingShardSource(FakeShardSource):
+    """Shard 1 kills its worker on the second sweep, once."""
+
+    def __init__(self, metrics, shard, shard_count, marker):
+        super().__init__(metrics, shard, shard_count)
+        self.marker = marker
+
+    def sample(self, batch):
+        if self.shard == 1 and self.sweep == 1 and not os.path.exists(self.marker):
+            open(self.marker, "w").close()
+            os._exit(3)
+        return super().sample(batch)
+
+
+class CrashingSourceFactory:
+    def __init__(self, marker):
+        self.marker = marker
+
+    def __call__(self, metrics, shard, shard_count):
+        return CrashingShardSource(metrics, shard, shard_count, self.marker)
+
+
+def test_dead_worker_is_replaced(tmp_path, capsys):
+    sampler = ShardedSampler(2, PROFILES["standard"], source_factory=CrashingSourceFactory(str(tmp_path / "crashed")))
+    try:
+        first = sampler.sample(SampleBatch())
+        assert sorted(first.pids[:len(first)]) == list(range(1, 101))
+        # Shard 1's worker dies; the shard is sampled in-process instead.
+        second = sampler.sample(SampleBatch())
+        assert (tmp_path / "crashed").exists()
+        assert "shard 1 died (exit code 3)" in capsys.readouterr().out
+        pids = set(second.pids[:len(second)])
+        assert {pid for pid in range(50, 151) if pid % 2 == 0} <= pids
+        assert any(pid % 2 for pid in pids)
+        # The restarted worker serves the following sweep.
+        third = sampler.sample(SampleBatch())
+        assert any(pid % 2 for pid in third.pids[:len(third)])
+        assert sampler._workers[1][0].is_alive()
+    finally:
+        sampler.close()
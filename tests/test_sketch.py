@@ -0,0 +1,114 @@
+import math
+import random
+
+import pytest
+
+from src.procmon.sketch import DDSketch, SketchAccumulator, hour_bucket
+from src.procmon.history import parse_percentiles
+
+QUANTILES = [0.5, 0.9, 0.95, 0.99, 1.0]
+
+def exact_quantile(values, q):
+    ordered = sorted(values)
+    return ordered[math.floor(q * (len(ordered) - 1))]
+
+def assert_within_accuracy(sketch, values):
+    for q in QUANTILES:
+        exact = exact_quantile(values, q)
+        estimate = sketch.quantile(q)
+        assert estimate == pytest.approx(exact, rel=sketch.relative_accuracy, abs=1e-4), f"q={q}"
+
+@pytest.mark.parametrize("distribution", ["uniform", "lognormal", "bursty"])
+def test_quantiles_match_exact_percentiles(distribution):
+    rng = random.Random(42)
+    if distribution == "uniform":
+        values = [rng.uniform(0, 100) for _ in range(20000)]
+    elif distribution == "lognormal":
+        values = [rng.lognormvariate(0, 2) for _ in range(20000)]
+    else:
+        # Mostly idle with occasional spikes, like a typical process.
+        values = [0.0 if rng.random() < 0.8 else rng.uniform(50, 400) for _ in range(20000)]
+
+    sketch = DDSketch()
+    for value in values:
+        sketch.add(value)
+
+    assert sketch.count == len(values)
+    assert_within_accuracy(sketch, values)
+
+def test_merged_buckets_match_exact_percentiles():
+    rng = random.Random(7)
+    buckets = [[rng.expovariate(1 / (1 + i % 24)) for _ in range(720)] for i in range(720)]
+
+    merged = DDSketch()
+    for values in buckets:
+        sketch = DDSketch()
+        for value in values:
+            sketch.add(value)
+        merged.merge(DDSketch.from_bytes(sketch.to_bytes()))
+
+    all_values = [value for values in buckets for value in values]
+    assert merged.count == len(all_values)
+    assert merged.avg == pytest.approx(sum(all_values) / len(all_values))
+    assert_within_accuracy(merged, all_values)
+
+def test_serialization_round_trip():
+    sketch = DDSketch()
+    for value in [0.0, 0.5, 3.0, 3.0, 250.0]:
+        sketch.add(value)
+    restored = DDSketch.from_bytes(sketch.to_bytes())
+    assert restored.bins == sketch.bins
+    assert (restored.count, restored.zero_count, restored.min, restored.max, restored.sum) == \
+        (sketch.count, sketch.zero_count, sketch.min, sketch.max, sketch.sum)
+
+def test_merge_bytes_matches_merge():
+    rng = random.Random(7)
+    parts = []
+    for _ in range(5):
+        part = DDSketch()
+        for _ in range(200):
+            part.add(rng.expovariate(0.2))
+        parts.append(part)
+    parts.append(DDSketch())
+
+    expected = DDSketch()
+    merged = DDSketch()
+    for part in parts:
+        expected.merge(part)
+        merged.merge_bytes(memoryview(part.to_bytes()))
+    assert merged.bins == expected.bins
+    assert (merged.count, merged.min, merged.max) == (expected.count, expected.min, expected.max)
+    assert merged.sum == pytest.approx(expected.sum)
+    with pytest.raises(ValueError):
+        merged.merge_bytes(_coarse_sketch_bytes())
+
+def _coarse_sketch_bytes():
+    sketch = DDSketch(relative_accuracy=0.05)
+    sketch.add(1.0)
+    return sketch.to_bytes()
+
+def test_empty_sketch():
+    sketch = DDSketch.from_bytes(DDSketch().to_bytes())
+    assert sketch.count == 0
+    assert sketch.quantile(0.99) is None
+
+def test_accumulator_groups_by_hour_and_name():
+    accumulator = SketchAccumulator()
+    accumulator.add(3600 * 10 + 5, "python", 10.0, 1.0)
+    accumulator.add(3600 * 10 + 3599, "python", 20.0, 2.0)
+    accumulator.add(3600 * 11, "python", 30.0, 3.0)
+    pending = accumulator.drain()
+    assert set(pending) == {(hour_bucket(36000), "python"), (hour_bucket(39600), "python")}
+    assert pending[(hour_bucket(36000), "python")][0].count == 2
+    assert accumulator.pending == {}
+
+    accumulator.add(3600 * 11 + 1, "python", 40.0, 4.0)
+    accumulator.restore(pending)
+    assert accumulator.pending[(hour_bucket(39600), "python")][1].count == 2
+
+def test_parse_percentiles():
+    assert parse_percentiles("99, 95") == [95.0, 99.0]
+    with pytest.raises(ValueError):
+        parse_percentiles("0")
+    with pytest.raises(ValueError):
+        parse_percentiles("p95")
@@ -0,0 +1,124 @@
+import mmap
+import struct
+import subprocess
+import sys
+import time
+
+from src.procmon.batch import SampleBatch
+from src.procmon.snapshot import SnapshotWriter, read_snapshot, snapshot_size, top_processes, TOP_N, _SEQ_OFFSET
+
+SYSTEM = (12.5, 40.0, 16 * 1024**3, 6 * 1024**3, 1000, 2000)
+NOW = time.time()
+
+def make_rows(count):
+    batch = SampleBatch()
+    for pid in range(1, count + 1):
+        # ROW_FIELDS order: pid, name, cpu, memory, rss, uss, threads, fds, ctx vol/invol, read, write
+        batch.append(pid, f"proc-{pid}", float(pid % 97), float(pid % 13), pid * 4096, None, pid % 8, None, None, None, pid * 10, pid * 5)
+    return batch
+
+def test_publish_and_read(tmp_path):
+    path = str(tmp_path / "snapshot.bin")
+    writer = SnapshotWriter(path, capacity=1000)
+    rows = make_rows(500)
+    writer.publish(NOW, SYSTEM, rows)
+
+    snapshot = read_snapshot(path, include_processes=True)
+    assert snapshot["timestamp"] == NOW
+    assert snapshot["process_count"] == 500
+    assert not snapshot["truncated"]
+    assert snapshot["system"]["memory_total"] == SYSTEM[2]
+    assert len(snapshot["processes"]) == 500
+    assert snapshot["processes"][41]["name"] == "proc-42"
+    assert snapshot["processes"][41]["rss"] == 42 * 4096
+    assert snapshot["processes"][41]["num_threads"] == 2
+
+    top_cpu = snapshot["top"]["cpu"]
+    assert len(top_cpu) == TOP_N
+    assert [p["cpu_percent"] for p in top_cpu] == sorted((p["cpu_percent"] for p in top_cpu), reverse=True)
+    assert top_cpu[0]["cpu_percent"] == 96.0
+    assert snapshot["top"]["io"][0]["pid"] == 500
+    assert "processes" not in read_snapshot(path)
+    writer.close()
+
+def test_republish_replaces_previous_sweep(tmp_path):
+    path = str(tmp_path / "snapshot.bin")
+    writer = SnapshotWriter(path, capacity=100)
+    writer.publish(NOW, SYSTEM, make_rows(50))
+    writer.publish(NOW + 1, SYSTEM, make_rows(3))
+    snapshot = read_snapshot(path, include_processes=True)
+    assert snapshot["timestamp"] == NOW + 1
+    assert [p["pid"] for p in snapshot["processes"]] == [1, 2, 3]
+    assert len(snapshot["top"]["memory"]) == 3
+    writer.close()
+
+def test_truncates_at_capacity(tmp_path):
+    path = str(tmp_path / "snapshot.bin")
+    writer = SnapshotWriter(path, capacity=10)
+    writer.publish(NOW, SYSTEM, make_rows(20))
+    snapshot = read_snapshot(path, include_processes=True)
+    assert snapshot["truncated"]
+    assert snapshot["process_count"] == 10
+    writer.close()
+
+def test_reader_rejects_in_progress_write(tmp_path):
+    path = str(tmp_path / "snapshot.bin")
+    writer = SnapshotWriter(path, capacity=10)
+    writer.publish(NOW, SYSTEM, make_rows(5))
+    struct.pack_into("<Q", writer._mm, _SEQ_OFFSET, 3)
+    assert read_snapshot(path, retries=5) is None
+    writer.close()
+
+def test_missing_or_unpublished_snapshot(tmp_path):
+    path = str(tmp_path / "snapshot.bin")
+    assert read_snapshot(path) is None
+    writer = SnapshotWriter(path, capacity=10)
+    assert read_snapshot(path) is None
+    writer.close()
+    assert not (tmp_path / "snapshot.bin").exists()
+
+def test_top_processes_beyond_index(tmp_path):
+    path = str(tmp_path / "snapshot.bin")
+    writer = SnapshotWriter(path, capacity=1000)
+    writer.publish(NOW, SYSTEM, make_rows(500))
+    assert len(top_processes(read_snapshot(path), "io", 100)) == TOP_N
+    ranked = top_processes(read_snapshot(path, include_processes=True), "io", 100)
+    assert [p["pid"] for p in ranked] == list(range(500, 400, -1))
+    assert top_processes(read_snapshot(path, include_processes=True), "cpu", 10) == read_snapshot(path)["top"]["cpu"][:10]
+    writer.close()
+
+def test_restart_replaces_file_without_truncating_readers(tmp_path):
+    path = str(tmp_path / "snapshot.bin")
+    old = SnapshotWriter(path, capacity=100)
+    old.publish(NOW, SYSTEM, make_rows(50))
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    new = SnapshotWriter(path, capacity=10)
+    # The old mapping still covers the full previous file; touching its last
+    # byte would raise SIGBUS had the file been truncated in place.
+    assert len(mapped) == snapshot_size(100)
+    assert mapped[len(mapped) - 1] == 0
+    mapped.close()
+    new.publish(NOW + 1, SYSTEM, make_rows(3))
+    # Closing the replaced writer must not delete the new collector's file.
+    old.close()
+    assert read_snapshot(path)["timestamp"] == NOW + 1
+    new.close()
+    assert not (tmp_path / "snapshot.bin").exists()
+    assert list(tmp_path.iterdir()) == []
+
+def test_stale_snapshots_are_not_served(tmp_path):
+    path = str(tmp_path / "snapshot.bin")
+    writer = SnapshotWriter(path, capacity=10)
+    writer.publish(time.time() - 3600, SYSTEM, make_rows(5))
+    assert read_snapshot(path) is None
+    assert read_snapshot(path, max_age=None)["process_count"] == 5
+
+    # A collector killed without cleanup leaves a fresh-looking file behind.
+    writer.publish(time.time(), SYSTEM, make_rows(5))
+    assert read_snapshot(path) is not None
+    exited = subprocess.Popen([sys.executable, "-c", ""])
+    exited.wait()
+    struct.pack_into("<I", writer._mm, 44, exited.pid)
+    assert read_snapshot(path) is None
+    writer.close()